@@ -9,7 +9,12 @@ See LICENSE file for more information.
 
 # Built-in/Generic Imports
 import logging
-from typing import Tuple, Union
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing import Pool
+from typing import List, Tuple, Union
 
 import cv2
 import matplotlib.pyplot as plt
@@ -17,6 +22,7 @@ import numpy as np
 import open3d as o3d
 from colmap_wrapper.visualization import COLMAP
 from PIL import Image
+from tqdm import tqdm
 
 
 def ray_cast_aruco_corners(
@@ -30,18 +36,232 @@ def ray_cast_aruco_corners(
     :param corners:
     :return:
     """
-    R, camera_origin = extrinsics[:3, :3], extrinsics[:3, 3]
-    aruco_corners = np.concatenate((corners[0][0], np.ones((4, 1))), axis=1)
-    rays = aruco_corners @ np.linalg.inv(intrinsics).T @ R.T
-    rays_norm = rays / np.linalg.norm(rays, ord=2, axis=1, keepdims=True)
+    camera_origins, rays_norm = ray_cast_aruco_corners_batched(
+        extrinsics=extrinsics[np.newaxis],
+        intrinsics=intrinsics[np.newaxis],
+        corners=np.asarray(corners[0][0])[np.newaxis],
+    )
+
+    return camera_origins[0], rays_norm[0]
+
+
+def ray_cast_aruco_corners_batched(
+    extrinsics: np.ndarray, intrinsics: np.ndarray, corners: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batched version of ray_cast_aruco_corners for K detections: n = x @ K^-1 @ R.T
+
+    The inverse intrinsics are only computed once for every distinct camera matrix, as usually all images share a
+    handful of cameras.
+
+    :param extrinsics: Camera to world transforms (K, 4, 4)
+    :param intrinsics: Intrinsic matrices (K, 3, 3)
+    :param corners: Aruco corners in image coordinates (K, 4, 2)
+    :return: Camera origins (K, 3) and normalized ray directions (K, 4, 3)
+    """
+    R, camera_origins = extrinsics[:, :3, :3], extrinsics[:, :3, 3]
+
+    cameras, camera_idx = np.unique(intrinsics.reshape(-1, 9), axis=0, return_inverse=True)
+    intrinsics_inv = np.linalg.inv(cameras.reshape(-1, 3, 3))[camera_idx.reshape(-1)]
+
+    aruco_corners = np.concatenate((corners, np.ones(corners.shape[:2] + (1,))), axis=2)
+    rays = np.einsum('kij,kcj->kci', R @ intrinsics_inv, aruco_corners)
+    rays_norm = rays / np.linalg.norm(rays, ord=2, axis=2, keepdims=True)
+
+    return camera_origins, rays_norm
+
+
+def create_aruco_detector(
+    dict_type: int = cv2.aruco.DICT_4X4_100,
+    aruco_parameters: cv2.aruco.DetectorParameters = None,
+) -> cv2.aruco.ArucoDetector:
+    """
+    Builds the aruco dictionary, detector parameters and detector.
+
+    :param dict_type: Predefined aruco dictionary
+    :param aruco_parameters: Detector parameters. Defaults are used if None
+    :return:
+    """
+    if aruco_parameters is None:
+        aruco_parameters = cv2.aruco.DetectorParameters()
+    aruco_dict = cv2.aruco.getPredefinedDictionary(dict_type)
+    return cv2.aruco.ArucoDetector(aruco_dict, aruco_parameters)
+
+
+# Supported downscale factors of the image markers are detected in
+DETECTION_REDUCTIONS = (1, 2, 4, 8)
+
+# Detector and detection reduction of the current worker (process or thread), see init_detection_worker
+_worker_state = threading.local()
+
+
+def init_detection_worker(dict_type: int = cv2.aruco.DICT_4X4_100, reduction: int = 1):
+    """
+    Pool initializer which builds the aruco detector once per worker instead of once per image. Only the dictionary
+    type is passed, as OpenCV objects cannot be pickled to spawned processes. The state is thread local, so the same
+    initializer works for process and thread pools.
+
+    :param dict_type: Predefined aruco dictionary
+    :param reduction: Detection reduction, see detect_aruco_marker
+    """
+    _worker_state.detector = create_aruco_detector(dict_type)
+    _worker_state.reduction = reduction
+
+
+def detect_aruco_marker_worker(image: str) -> Tuple[tuple, np.ndarray, tuple]:
+    """
+    detect_aruco_marker with the detector of the worker. Requires init_detection_worker as pool initializer.
+
+    :param image: Path to the image
+    :return: See detect_aruco_marker
+    """
+    return detect_aruco_marker(image, detector=_worker_state.detector, reduction=_worker_state.reduction)
+
+
+def detect_aruco_markers(
+    image_paths: List[str],
+    dict_type: int = cv2.aruco.DICT_4X4_100,
+    reduction: int = 1,
+    backend: str = "process",
+    num_workers: int = None,
+    chunksize: int = None,
+    progress_bar: bool = True,
+    num_readers: int = 8,
+    prefetch: int = None,
+) -> list:
+    """
+    Runs detect_aruco_marker on many images in parallel.
+
+    :param image_paths: Paths to the images
+    :param dict_type: Predefined aruco dictionary
+    :param reduction: Detection reduction, see detect_aruco_marker
+    :param backend: 'process' for a multiprocessing Pool or 'thread' for a ThreadPoolExecutor. OpenCV releases the
+        GIL while decoding and detecting, so threads run in parallel as well and save the process startup and the
+        pickling of the results. 'pipeline' splits reading from decoding, see detect_aruco_markers_pipelined
+    :param num_workers: Number of worker processes or threads. Defaults to the number of CPUs
+    :param chunksize: Images per task of the process pool, None: len(image_paths) / (4 * num_workers)
+    :param progress_bar: Show a progress bar
+    :param num_readers: Number of I/O threads of the pipeline backend
+    :param prefetch: Maximum number of read but not yet decoded images of the pipeline backend
+    :return: Results of detect_aruco_marker in the order of image_paths
+    """
+    if backend not in ("process", "thread", "pipeline"):
+        raise ValueError(f"Unknown detection backend '{backend}', use 'process', 'thread' or 'pipeline'")
+    if len(image_paths) == 0:
+        return []
+
+    num_workers = num_workers or os.cpu_count()
+    if backend == "pipeline":
+        return detect_aruco_markers_pipelined(image_paths, dict_type=dict_type, reduction=reduction,
+                                              num_workers=num_workers, num_readers=num_readers, prefetch=prefetch,
+                                              progress_bar=progress_bar)
+    if backend == "thread":
+        with ThreadPoolExecutor(num_workers, initializer=init_detection_worker,
+                                initargs=(dict_type, reduction)) as executor:
+            return list(tqdm(executor.map(detect_aruco_marker_worker, image_paths),
+                             total=len(image_paths), disable=not progress_bar))
+
+    # Hand out images in chunks to keep the dispatch overhead low on datasets with many small frames
+    chunksize = chunksize or max(1, len(image_paths) // (4 * num_workers))
+    with Pool(num_workers, initializer=init_detection_worker, initargs=(dict_type, reduction)) as p:
+        return list(tqdm(p.imap(detect_aruco_marker_worker, image_paths, chunksize=chunksize),
+                         total=len(image_paths), disable=not progress_bar))
+
+
+def detect_aruco_markers_pipelined(
+    image_paths: List[str],
+    dict_type: int = cv2.aruco.DICT_4X4_100,
+    reduction: int = 1,
+    num_workers: int = None,
+    num_readers: int = 8,
+    prefetch: int = None,
+    progress_bar: bool = True,
+) -> list:
+    """
+    Producer/consumer version of detect_aruco_markers for slow (e.g. network mounted) storage. I/O threads read the
+    encoded bytes into a bounded queue while decode+detect threads consume them, so file latency and CPU work
+    overlap. Readers block once prefetch images are waiting, which caps the memory of the queue.
+
+        read (num_readers) --> queue (prefetch) --> decode + detect (num_workers)
+
+    :param image_paths: Paths to the images
+    :param dict_type: Predefined aruco dictionary
+    :param reduction: Detection reduction, see detect_aruco_marker
+    :param num_workers: Number of decode+detect threads. Defaults to the number of CPUs
+    :param num_readers: Number of I/O threads
+    :param prefetch: Maximum number of images in the queue. Defaults to 2 * num_workers
+    :param progress_bar: Show a progress bar
+    :return: Results of detect_aruco_marker in the order of image_paths
+    """
+    num_workers = num_workers or os.cpu_count()
+    buffers = queue.Queue(maxsize=prefetch or 2 * num_workers)
+    results = [None] * len(image_paths)
+    errors = []
+
+    def read(indices):
+        for idx in indices:
+            buffers.put((idx, read_image_buffer(image_paths[idx])))
+
+    def detect(progress):
+        init_detection_worker(dict_type, reduction)
+        while True:
+            item = buffers.get()
+            if item is None:
+                return
+            idx, data = item
+            try:
+                results[idx] = detect_aruco_marker_in_buffer(data, detector=_worker_state.detector,
+                                                             reduction=reduction, image_path=image_paths[idx])
+            except Exception as e:
+                # Keep consuming, otherwise the readers block on the full queue
+                errors.append(e)
+            progress.update()
+
+    with tqdm(total=len(image_paths), disable=not progress_bar) as progress:
+        with ThreadPoolExecutor(num_workers + num_readers) as executor:
+            detectors = [executor.submit(detect, progress) for _ in range(num_workers)]
+            readers = [executor.submit(read, range(reader, len(image_paths), num_readers))
+                       for reader in range(num_readers)]
+            # One stop signal per detection thread once everything is queued
+            wait(readers)
+            for _ in detectors:
+                buffers.put(None)
+            for future in readers + detectors:
+                future.result()
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def refine_aruco_corners(image: np.ndarray, corners: tuple, reduction: int) -> tuple:
+    """
+    Maps corners detected at 1/reduction resolution to full resolution and refines them with cornerSubPix. Only a
+    small window around every corner is evaluated.
+
+    :param image: Full resolution grayscale image
+    :param corners: Corners as returned by detectMarkers on the reduced image
+    :param reduction: Downscale factor of the image the corners were detected in
+    :return: Refined corners in full resolution image coordinates, same layout as corners
+    """
+    points = np.concatenate([c.reshape(-1, 2) for c in corners]).astype(np.float32)
+    # Pixel centers: x_full = (x_reduced + 0.5) * reduction - 0.5
+    points = ((points + 0.5) * reduction - 0.5).reshape(-1, 1, 2)
+
+    half_window = max(3, 2 * reduction)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    points = cv2.cornerSubPix(image, points, (half_window, half_window), (-1, -1), criteria)
+
+    return tuple(points.reshape(-1, 1, 4, 2))
 
-    return camera_origin, rays_norm
 
 def detect_aruco_marker(
-    image: np.ndarray,
+    image: str,
     dict_type: int = cv2.aruco.DICT_4X4_100,
-    aruco_parameters: cv2.aruco.DetectorParameters = cv2.aruco.DetectorParameters(),
-) -> Tuple[tuple, np.ndarray]:
+    aruco_parameters: cv2.aruco.DetectorParameters = None,
+    detector: cv2.aruco.ArucoDetector = None,
+    reduction: int = 1,
+) -> Tuple[tuple, np.ndarray, tuple]:
     """
     Info: https://docs.opencv.org/4.x/d5/dae/tutorial_aruco_detection.html
     More information on aruco parameters: https://docs.opencv.org/4.x/d1/dcd/structcv_1_1aruco_1_1DetectorParameters.html
@@ -49,6 +269,10 @@ def detect_aruco_marker(
     @param dict_type:
     @param image:
     @param aruco_parameters:
+    @param detector: Prebuilt detector (see create_aruco_detector). dict_type and aruco_parameters are ignored if set
+    @param reduction: 1, 2, 4 or 8. Markers are detected in the image downscaled to 1/reduction resolution and the
+        corners are refined on the full resolution pixels around them. The returned corners and image size are always
+        at full resolution
 
     Aruco Corners
 
@@ -63,14 +287,91 @@ def detect_aruco_marker(
     :return:
     """
 
-    image = cv2.imread(image)
+    return detect_aruco_marker_in_buffer(read_image_buffer(image), dict_type=dict_type,
+                                         aruco_parameters=aruco_parameters, detector=detector, reduction=reduction,
+                                         image_path=image)
+
+
+def read_image_buffer(image_path: str) -> Union[np.ndarray, None]:
+    """
+    Reads the encoded bytes of an image file.
+
+    :param image_path: Path to the image
+    :return: Bytes as uint8 array or None if the file cannot be read
+    """
+    try:
+        return np.fromfile(image_path, dtype=np.uint8)
+    except OSError:
+        return None
+
+
+def detect_aruco_marker_in_buffer(
+    data: Union[np.ndarray, None],
+    dict_type: int = cv2.aruco.DICT_4X4_100,
+    aruco_parameters: cv2.aruco.DetectorParameters = None,
+    detector: cv2.aruco.ArucoDetector = None,
+    reduction: int = 1,
+    image_path: str = "<buffer>",
+) -> Tuple[tuple, np.ndarray, tuple]:
+    """
+    detect_aruco_marker on the encoded bytes of an image (see read_image_buffer), so reading and decoding can run in
+    different threads.
+
+    :param data: Encoded image as uint8 array, None if it could not be read
+    :param image_path: Path of the image, only used for logging
+    :return: See detect_aruco_marker
+    """
+    # The detector works on grayscale images anyway, decoding straight to grayscale skips the color conversion.
+    # The image is decoded once at full resolution, a reduction only downscales it for detection (see
+    # detect_aruco_marker_in_image)
+    image = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE) if data is not None and data.size > 0 else None
     if image is None:
-        logging.warning(f"Failed to load image: {image}")
+        logging.warning(f"Failed to load image: {image_path}")
         return None, None
-    image_size = image.shape
-    aruco_dict = cv2.aruco.getPredefinedDictionary(dict_type)
-    detector = cv2.aruco.ArucoDetector(aruco_dict, aruco_parameters)
-    corners, aruco_id, _ = detector.detectMarkers(image)
+
+    return detect_aruco_marker_in_image(image, dict_type=dict_type, aruco_parameters=aruco_parameters,
+                                        detector=detector, reduction=reduction)
+
+
+def detect_aruco_marker_in_image(
+    image: np.ndarray,
+    dict_type: int = cv2.aruco.DICT_4X4_100,
+    aruco_parameters: cv2.aruco.DetectorParameters = None,
+    detector: cv2.aruco.ArucoDetector = None,
+    reduction: int = 1,
+) -> Tuple[tuple, np.ndarray, tuple]:
+    """
+    detect_aruco_marker on an already decoded image, e.g. a video frame. With a reduction the image is downscaled for
+    detection and the corners are refined on the full image.
+
+    :param image: Grayscale or BGR image
+    :return: See detect_aruco_marker
+    """
+    if reduction not in DETECTION_REDUCTIONS:
+        raise ValueError(f"reduction must be one of {list(DETECTION_REDUCTIONS)}, got {reduction}")
+    if detector is None:
+        detector = create_aruco_detector(dict_type, aruco_parameters)
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    if reduction == 1:
+        corners, aruco_id, _ = detector.detectMarkers(image)
+    else:
+        reduced = cv2.resize(image, (-(-image.shape[1] // reduction), -(-image.shape[0] // reduction)),
+                             interpolation=cv2.INTER_AREA)
+        corners, aruco_id, _ = detector.detectMarkers(reduced)
+        if aruco_id is not None:
+            corners = refine_aruco_corners(image, corners, reduction)
+
     if aruco_id is None:
-        return None, None, image_size
-    return corners, aruco_id, image_size
+        return None, None, image.shape
+    # (N, 1) ids as in OpenCV 4, newer versions return (N,)
+    return corners, aruco_id.reshape(-1, 1), image.shape
+
+
+def detect_aruco_marker_in_image_worker(image: np.ndarray) -> Tuple[tuple, np.ndarray, tuple]:
+    """
+    detect_aruco_marker_in_image with the detector of the worker. Requires init_detection_worker as pool initializer.
+    """
+    return detect_aruco_marker_in_image(image, detector=_worker_state.detector, reduction=_worker_state.reduction)
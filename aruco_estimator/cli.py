@@ -28,8 +28,26 @@ def main():
               help='Export ArUco tag positions to a JSON file')
 @click.option('--export-path', type=click.Path(),
               help='Path to export ArUco tag positions (default: project_path/aruco_tags.json)')
+@click.option('--robust', is_flag=True,
+              help='Reject misdetected views with RANSAC and refine the marker corners with IRLS')
+@click.option('--no-cache', is_flag=True,
+              help='Detect markers in all images instead of reusing the detections of unchanged images')
+@click.option('--backend', type=click.Choice(['process', 'thread', 'pipeline']), default='process',
+              help='Run marker detection in worker processes, threads or a read/decode pipeline of threads '
+                   '(default: process)')
+@click.option('--workers', type=int, default=None,
+              help='Number of detection workers (default: number of CPUs)')
+@click.option('--video', type=click.Path(exists=True),
+              help='Read the frames from the video the images were extracted from instead of the image files')
+@click.option('--video-stride', type=int, default=1,
+              help='Number of video frames between two extracted images (default: 1)')
+@click.option('--video-first-index', type=int, default=1,
+              help='Number in the name of the first extracted image (default: 1)')
+@click.option('--transform-dense', is_flag=True,
+              help='Also write the normalized dense point cloud (streamed, binary PLY only) to normalized/fused.ply')
 def reassign_origin_cmd(colmap_project, aruco_size, dict_type, show_original, visualize, 
-                        target_id, export_tags, export_path):
+                        target_id, export_tags, export_path, robust, no_cache, backend, workers,
+                        video, video_stride, video_first_index, transform_dense):
     """Normalize COLMAP poses relative to ArUco marker."""
     reassign_origin(
         colmap_project=colmap_project,
@@ -39,7 +57,15 @@ def reassign_origin_cmd(colmap_project, aruco_size, dict_type, show_original, vi
         visualize=visualize,
         target_id=target_id,
         export_tags=export_tags,
-        export_path=export_path
+        export_path=export_path,
+        robust=robust,
+        cache=not no_cache,
+        backend=backend,
+        num_workers=workers,
+        video=video,
+        video_stride=video_stride,
+        video_first_index=video_first_index,
+        transform_dense=transform_dense
     )
 
 
@@ -57,7 +83,19 @@ def reassign_origin_cmd(colmap_project, aruco_size, dict_type, show_original, vi
               help='Number of points per dimension in grid')
 @click.option('--skip-copy', is_flag=True,
               help='Skip saving visualization images, only save labels')
-def reverse_project_cmd(colmap_path, images_path, output_dir, key_positions, grid_min, grid_max, grid_points, skip_copy):
+@click.option('--workers', type=int, default=None,
+              help='Number of processes writing labels (default: number of CPUs)')
+@click.option('--occlusion', type=str, default=None,
+              help="Label key positions hidden behind 'sparse' COLMAP points or a binary PLY point cloud as occluded")
+@click.option('--occlusion-downscale', type=int, default=8,
+              help='Pixel size of the depth buffer cells used for the occlusion test (default: 8)')
+@click.option('--label-format', type=click.Choice(['yolo', 'jsonl', 'npz']), default='yolo',
+              help='One YOLO label file per image, or the labels of --shard-size images per JSONL/NPZ file '
+                   '(default: yolo)')
+@click.option('--shard-size', type=int, default=1000,
+              help='Number of images per JSONL/NPZ label file (default: 1000)')
+def reverse_project_cmd(colmap_path, images_path, output_dir, key_positions, grid_min, grid_max, grid_points, skip_copy,
+                        workers, occlusion, occlusion_downscale, label_format, shard_size):
     """Project 3D points onto images and create dataset."""
     reverse_project(
         colmap_path=colmap_path,
@@ -67,7 +105,12 @@ def reverse_project_cmd(colmap_path, images_path, output_dir, key_positions, gri
         grid_min=grid_min,
         grid_max=grid_max,
         grid_points=grid_points,
-        skip_copy=skip_copy
+        skip_copy=skip_copy,
+        num_workers=workers,
+        occlusion=occlusion,
+        occlusion_downscale=occlusion_downscale,
+        label_format=label_format,
+        shard_size=shard_size
     )
 
 
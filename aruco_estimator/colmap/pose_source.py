@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import open3d as o3d
+
+from .read_write_model import qvecs2rotmats
+from .reconstruction import Reconstruction
+
+
+def camera_matrix(camera) -> np.ndarray:
+    """
+    Intrinsic matrix K (3, 3) of a COLMAP camera. Distortion parameters are ignored.
+
+    :param camera: Camera namedtuple
+    :return: K
+    """
+    if camera.model in ("SIMPLE_PINHOLE", "SIMPLE_RADIAL", "RADIAL", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE"):
+        fx = fy = camera.params[0]
+        cx, cy = camera.params[1:3]
+    elif camera.model in ("PINHOLE", "OPENCV", "OPENCV_FISHEYE", "FULL_OPENCV", "FOV", "THIN_PRISM_FISHEYE"):
+        fx, fy, cx, cy = camera.params[0:4]
+    else:
+        raise ValueError(f"Camera model not supported: {camera.model}")
+
+    return np.array([[fx, 0, cx],
+                     [0, fy, cy],
+                     [0, 0, 1]], dtype=float)
+
+
+class Intrinsics:
+    def __init__(self, camera):
+        self.camera = camera
+        self.K = camera_matrix(camera)
+
+
+class PoseImage:
+    def __init__(self, image_id: int, qvec: np.ndarray, tvec: np.ndarray, camera_id: int, name: str,
+                 extrinsics: np.ndarray, intrinsics: Intrinsics, xys: np.ndarray, point3D_ids: np.ndarray):
+        """
+        Pose of a single image, with the attributes of the colmap_wrapper image used by the localizers and the 2D
+        points needed to write the image back as COLMAP model.
+
+        :param extrinsics: Camera to world transform (4, 4)
+        :param xys: 2D points of the image (P, 2)
+        :param point3D_ids: 3D point id of every 2D point (P,), -1 if not triangulated
+        """
+        self.id = image_id
+        self.qvec = qvec
+        self.tvec = tvec
+        self.camera_id = camera_id
+        self.name = name
+        self.extrinsics = extrinsics
+        self.intrinsics = intrinsics
+        self.xys = xys
+        self.point3D_ids = point3D_ids
+
+
+class PoseSource:
+    def __init__(self, project_path: str, reconstruction: Reconstruction = None, dense_pc: str = 'fused.ply'):
+        """
+        Lightweight replacement of the colmap_wrapper COLMAP project for the ArucoLocalizer. Only cameras and image
+        poses are read, the dense point cloud and the sparse points are loaded on first access, so marker detection
+        starts without loading the dense data of large projects.
+
+        The folders follow the colmap_wrapper layout: poses from project_path/sparse (or sparse/0), images from
+        project_path/dense/images (or dense/0/images, or project_path/images without dense folder).
+
+        :param project_path: Path to the COLMAP project
+        :param reconstruction: Already loaded sparse model, read from project_path/sparse if None
+        :param dense_pc: Name of the dense point cloud in the dense folder
+        """
+        self._project_path = Path(project_path).expanduser()
+
+        sparse_path = self._project_path.joinpath('sparse')
+        if sparse_path.joinpath('0').exists():
+            sparse_path = sparse_path.joinpath('0')
+
+        dense_path = self._project_path.joinpath('dense')
+        if dense_path.joinpath('0').exists():
+            dense_path = dense_path.joinpath('0')
+        if not dense_path.exists():
+            dense_path = self._project_path
+
+        self._sparse_base_path = sparse_path
+        self._dense_base_path = dense_path
+        self._src_image_path = dense_path.joinpath('images')
+        self._fused_path = dense_path.joinpath(dense_pc)
+
+        self.reconstruction = reconstruction if reconstruction is not None else Reconstruction.read(str(sparse_path))
+        self.cameras = self.reconstruction.cameras
+
+        # Camera to world transforms of all images at once
+        R = qvecs2rotmats(self.reconstruction.qvec).transpose(0, 2, 1)
+        extrinsics = np.tile(np.eye(4), (self.reconstruction.num_images, 1, 1))
+        extrinsics[:, :3, :3] = R
+        extrinsics[:, :3, 3] = -np.einsum('kij,kj->ki', R, self.reconstruction.tvec)
+
+        intrinsics = {camera_id: Intrinsics(camera) for camera_id, camera in self.cameras.items()}
+        offsets = self.reconstruction.points2D_offsets
+        self.images = {}
+        for row, image_id in enumerate(self.reconstruction.image_ids.tolist()):
+            camera_id = int(self.reconstruction.camera_ids[row])
+            points2D = slice(offsets[row], offsets[row + 1])
+            self.images[image_id] = PoseImage(image_id=image_id,
+                                              qvec=self.reconstruction.qvec[row],
+                                              tvec=self.reconstruction.tvec[row],
+                                              camera_id=camera_id,
+                                              name=self.reconstruction.names[row],
+                                              extrinsics=extrinsics[row],
+                                              intrinsics=intrinsics[camera_id],
+                                              xys=self.reconstruction.xys[points2D],
+                                              point3D_ids=self.reconstruction.point3D_ids[points2D])
+
+        self.__sparse = None
+        self.__dense = None
+
+    @property
+    def projects(self):
+        # Same access as colmap_wrapper COLMAP with a single project
+        return self
+
+    @property
+    def sparse(self) -> dict:
+        if self.__sparse is None:
+            self.__sparse = self.reconstruction.to_dicts()[2]
+        return self.__sparse
+
+    @sparse.setter
+    def sparse(self, sparse: dict):
+        self.__sparse = sparse
+
+    @property
+    def dense(self) -> o3d.geometry.PointCloud:
+        if self.__dense is None:
+            self.__dense = o3d.io.read_point_cloud(str(self._fused_path))
+        return self.__dense
+
+    @dense.setter
+    def dense(self, dense: o3d.geometry.PointCloud):
+        self.__dense = dense
+
+    def get_sparse(self) -> dict:
+        return self.sparse
+
+    def get_dense(self) -> o3d.geometry.PointCloud:
+        return self.dense
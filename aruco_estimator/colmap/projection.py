@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+
+Vectorized projection of 3D points into COLMAP images. The camera models follow
+https://github.com/colmap/colmap/blob/main/src/colmap/sensor/models.h
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+# Models with a single focal length, the remaining ones start with fx, fy
+SINGLE_FOCAL_MODELS = ("SIMPLE_PINHOLE", "SIMPLE_RADIAL", "RADIAL", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE")
+
+EPSILON = np.finfo(np.float64).eps
+
+
+def split_camera_params(model: str, params: np.ndarray) -> Tuple[float, float, float, float, np.ndarray]:
+    """
+    Splits the parameters of a COLMAP camera into focal lengths, principal point and extra (distortion) parameters.
+
+    :param model: Camera model name
+    :param params: Camera parameters
+    :return: fx, fy, cx, cy, extra parameters
+    """
+    params = np.asarray(params, dtype=np.float64)
+    if model in SINGLE_FOCAL_MODELS:
+        return params[0], params[0], params[1], params[2], params[3:]
+    return params[0], params[1], params[2], params[3], params[4:]
+
+
+def _fisheye_theta(u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Equidistant mapping (theta * u / r, theta * v / r) of normalized coordinates, identity close to the center.
+    """
+    r = np.sqrt(u ** 2 + v ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(r > EPSILON, np.arctan(r) / r, 1.)
+    return u * scale, v * scale
+
+
+def distort_points(model: str, extra: np.ndarray, u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Applies the distortion of a camera model to normalized image coordinates (x/z, y/z).
+
+    :param model: Camera model name
+    :param extra: Extra parameters of the camera, see split_camera_params
+    :param u: Normalized x coordinates, any shape
+    :param v: Normalized y coordinates, same shape as u
+    :return: Distorted normalized coordinates (u, v)
+    """
+    if model in ("SIMPLE_PINHOLE", "PINHOLE"):
+        return u, v
+
+    if model in ("SIMPLE_RADIAL", "RADIAL", "OPENCV", "FULL_OPENCV"):
+        u2, v2, uv = u * u, v * v, u * v
+        r2 = u2 + v2
+        if model == "SIMPLE_RADIAL":
+            radial = 1 + extra[0] * r2
+        elif model == "FULL_OPENCV":
+            k1, k2, p1, p2, k3, k4, k5, k6 = extra[:8]
+            radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (1 + r2 * (k4 + r2 * (k5 + r2 * k6)))
+        else:
+            radial = 1 + extra[0] * r2 + extra[1] * r2 * r2
+
+        if model in ("OPENCV", "FULL_OPENCV"):
+            p1, p2 = extra[2:4]
+            return (u * radial + 2 * p1 * uv + p2 * (r2 + 2 * u2),
+                    v * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2))
+        return u * radial, v * radial
+
+    if model in ("SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE", "OPENCV_FISHEYE"):
+        r = np.sqrt(u * u + v * v)
+        theta = np.arctan(r)
+        theta2 = theta * theta
+        if model == "SIMPLE_RADIAL_FISHEYE":
+            coefficients = extra[:1]
+        elif model == "RADIAL_FISHEYE":
+            coefficients = extra[:2]
+        else:
+            coefficients = extra[:4]
+        theta_d = np.ones_like(theta)
+        for power, k in enumerate(coefficients, 1):
+            theta_d = theta_d + k * theta2 ** power
+        theta_d = theta * theta_d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(r > EPSILON, theta_d / r, 1.)
+        return u * scale, v * scale
+
+    if model == "THIN_PRISM_FISHEYE":
+        k1, k2, p1, p2, k3, k4, sx1, sy1 = extra[:8]
+        uu, vv = _fisheye_theta(u, v)
+        u2, v2, uv = uu * uu, vv * vv, uu * vv
+        r2 = u2 + v2
+        radial = r2 * (k1 + r2 * (k2 + r2 * (k3 + r2 * k4)))
+        return (uu + uu * radial + 2 * p1 * uv + p2 * (r2 + 2 * u2) + sx1 * r2,
+                vv + vv * radial + 2 * p2 * uv + p1 * (r2 + 2 * v2) + sy1 * r2)
+
+    if model == "FOV":
+        omega = extra[0]
+        omega2 = omega * omega
+        r2 = u * u + v * v
+        if omega2 < 1e-4:
+            factor = (omega2 * r2) / 3 - omega2 / 12 + 1
+        else:
+            tan_half_omega = np.tan(omega / 2)
+            r = np.sqrt(r2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factor = np.where(r2 < 1e-4,
+                                  (-2 * tan_half_omega * (4 * r2 * tan_half_omega ** 2 - 3)) / (3 * omega),
+                                  np.arctan(r * 2 * tan_half_omega) / (r * omega))
+        return u * factor, v * factor
+
+    raise ValueError(f"Unsupported camera model: {model}")
+
+
+def project_points_batched(points: np.ndarray, R: np.ndarray, t: np.ndarray, cameras: dict, camera_ids,
+                           max_elements: int = 1 << 20) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Projects N 3D points into M images at once. Images are processed in blocks of at most max_elements
+    (image, point) pairs, which bounds the memory of the intermediate arrays.
+
+    :param points: 3D points in world coordinates (N, 3)
+    :param R: World to camera rotations (M, 3, 3)
+    :param t: World to camera translations (M, 3)
+    :param cameras: Dict of COLMAP cameras
+    :param camera_ids: Camera ID of every image (M,)
+    :param max_elements: Maximum number of (image, point) pairs per block
+    :return: Pixel coordinates (M, N, 2) with NaN behind the camera, mask of points in front of the camera (M, N) and
+        mask of points in front of the camera and inside the image (M, N)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    R = np.asarray(R, dtype=np.float64).reshape(-1, 3, 3)
+    t = np.asarray(t, dtype=np.float64).reshape(-1, 3)
+    camera_ids = np.asarray(camera_ids).reshape(-1)
+    num_images, num_points = len(R), len(points)
+
+    pixels = np.full((num_images, num_points, 2), np.nan)
+    in_front = np.zeros((num_images, num_points), dtype=bool)
+    in_image = np.zeros((num_images, num_points), dtype=bool)
+
+    block = max(1, max_elements // max(1, num_points))
+    for start in range(0, num_images, block):
+        stop = min(start + block, num_images)
+
+        # Camera coordinates of all points in the images of the block (B, N, 3)
+        points_cam = points @ R[start:stop].transpose(0, 2, 1) + t[start:stop, np.newaxis, :]
+        front = points_cam[..., 2] > 0
+        in_front[start:stop] = front
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = points_cam[..., 0] / points_cam[..., 2]
+            v = points_cam[..., 1] / points_cam[..., 2]
+
+        # Distortion differs per camera model, usually only a few cameras are shared by all images
+        block_camera_ids = camera_ids[start:stop]
+        for camera_id in np.unique(block_camera_ids):
+            camera = cameras[camera_id]
+            rows = np.flatnonzero(block_camera_ids == camera_id)
+            fx, fy, cx, cy, extra = split_camera_params(camera.model, camera.params)
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                du, dv = distort_points(camera.model, extra, u[rows], v[rows])
+                x, y = fx * du + cx, fy * dv + cy
+
+            visible = front[rows]
+            pixels[start + rows, :, 0] = np.where(visible, x, np.nan)
+            pixels[start + rows, :, 1] = np.where(visible, y, np.nan)
+            in_image[start + rows] = visible & (x >= 0) & (x < camera.width) & (y >= 0) & (y < camera.height)
+
+    return pixels, in_front, in_image
+
+
+def _depth_cells(pixels: np.ndarray, in_image: np.ndarray, widths: np.ndarray, num_cells: int,
+                 downscale: int) -> np.ndarray:
+    """
+    Flat depth buffer index of the pixels inside the image, buffers of consecutive images are num_cells apart.
+    """
+    rows, columns = np.nonzero(in_image)
+    xy = pixels[rows, columns].astype(np.int64) // downscale
+    return rows * num_cells + xy[:, 1] * widths[rows] + xy[:, 0]
+
+
+def occluded_points(points: np.ndarray, cloud: np.ndarray, R: np.ndarray, t: np.ndarray, cameras: dict, camera_ids,
+                    downscale: int = 8, tolerance: float = 0.05, max_elements: int = 1 << 22) -> np.ndarray:
+    """
+    Tests which points are hidden behind the geometry of a point cloud. The cloud is splatted into a depth buffer
+    of every image at 1/downscale of its resolution, keeping the closest depth per cell. A point is occluded if it
+    lies inside the image and is more than tolerance (relative) behind the depth of its cell.
+
+    The depth buffers are built for blocks of images and the cloud is splatted in chunks, so at most max_elements
+    (image, point) pairs are projected at once.
+
+    :param points: Points to test (N, 3)
+    :param cloud: Occluding points, e.g. the sparse or dense reconstruction (P, 3)
+    :param R: World to camera rotations (M, 3, 3)
+    :param t: World to camera translations (M, 3)
+    :param cameras: Dict of COLMAP cameras
+    :param camera_ids: Camera ID of every image (M,)
+    :param downscale: Size of a depth buffer cell in pixels. Larger cells close the gaps between sparse points
+    :param tolerance: Relative depth margin before a point counts as occluded
+    :param max_elements: Maximum number of (image, point) pairs and depth buffer cells per block
+    :return: Mask of occluded points (M, N)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    cloud = np.asarray(cloud).reshape(-1, 3)
+    R = np.asarray(R, dtype=np.float64).reshape(-1, 3, 3)
+    t = np.asarray(t, dtype=np.float64).reshape(-1, 3)
+    camera_ids = np.asarray(camera_ids).reshape(-1)
+    num_images = len(R)
+
+    occluded = np.zeros((num_images, len(points)), dtype=bool)
+    if len(points) == 0 or len(cloud) == 0:
+        return occluded
+
+    # Depth buffer size of every image
+    buffer_width = np.array([-(-cameras[camera_id].width // downscale) for camera_id in camera_ids])
+    buffer_height = np.array([-(-cameras[camera_id].height // downscale) for camera_id in camera_ids])
+    num_cells = int(np.max(buffer_width * buffer_height))
+
+    block = max(1, max_elements // max(num_cells, len(points)))
+    cloud_chunk = max(1, max_elements // block)
+    for start in range(0, num_images, block):
+        stop = min(start + block, num_images)
+        widths = buffer_width[start:stop]
+        depth = np.full((stop - start) * num_cells, np.inf)
+
+        for chunk_start in range(0, len(cloud), cloud_chunk):
+            chunk = cloud[chunk_start:chunk_start + cloud_chunk].astype(np.float64)
+            pixels, _, in_image = project_points_batched(chunk, R[start:stop], t[start:stop], cameras,
+                                                         camera_ids[start:stop], max_elements=max_elements)
+            z = R[start:stop, 2] @ chunk.T + t[start:stop, 2, np.newaxis]
+
+            np.minimum.at(depth, _depth_cells(pixels, in_image, widths, num_cells, downscale), z[in_image])
+
+        pixels, _, in_image = project_points_batched(points, R[start:stop], t[start:stop], cameras,
+                                                     camera_ids[start:stop], max_elements=max_elements)
+        z = R[start:stop, 2] @ points.T + t[start:stop, 2, np.newaxis]
+        block_occluded = np.zeros_like(in_image)
+        block_occluded[in_image] = (z[in_image] >
+                                    depth[_depth_cells(pixels, in_image, widths, num_cells, downscale)] * (1 + tolerance))
+        occluded[start:stop] = block_occluded
+
+    return occluded
@@ -74,6 +74,28 @@ CAMERA_MODEL_NAMES = dict(
     [(camera_model.model_name, camera_model) for camera_model in CAMERA_MODELS]
 )
 
+# Packed on-disk record layouts of the binary model files. They are used to
+# decode whole files with np.frombuffer instead of one struct call per field.
+IMAGE_HEADER_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("qvec", "<f8", (4,)),
+        ("tvec", "<f8", (3,)),
+        ("camera_id", "<i4"),
+    ]
+)
+POINT2D_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+POINT3D_HEADER_DTYPE = np.dtype(
+    [
+        ("id", "<u8"),
+        ("xyz", "<f8", (3,)),
+        ("rgb", "u1", (3,)),
+        ("error", "<f8"),
+        ("track_length", "<u8"),
+    ]
+)
+TRACK_ELEM_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
 
 def read_next_bytes(fid, num_bytes, format_char_sequence, endian_character="<"):
     """Read and unpack the next bytes from a binary file.
@@ -197,6 +219,10 @@ def write_cameras_binary(cameras, path_to_model_file):
         write_next_bytes(fid, len(cameras), "Q")
         for _, cam in cameras.items():
             model_id = CAMERA_MODEL_NAMES[cam.model].model_id
+            num_params = CAMERA_MODEL_NAMES[cam.model].num_params
+            if len(cam.params) != num_params:
+                raise ValueError(f"Camera {cam.id} has {len(cam.params)} params, "
+                                 f"model {cam.model} expects {num_params}")
             camera_properties = [cam.id, model_id, cam.width, cam.height]
             write_next_bytes(fid, camera_properties, "iiQQ")
             for p in cam.params:
@@ -244,54 +270,200 @@ def read_images_text(path):
     return images
 
 
-def read_images_binary(path_to_model_file):
+def _split_rows(values, offsets):
+    """Split values into the CSR-style segments given by offsets. Much
+    cheaper than np.split for millions of small segments."""
+    offsets = offsets.tolist()
+    return [values[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def _span_mask(size, starts, length):
+    """Boolean mask of length size that is True on [start, start + length)
+    for every entry of starts. Spans must not overlap."""
+    delta = np.zeros(size + 1, dtype=np.int8)
+    delta[starts] = 1
+    delta[starts + length] -= 1
+    return np.cumsum(delta[:-1], dtype=np.int8).view(bool)
+
+
+def images_to_columns(images):
+    """Stack a dict of Image namedtuples into the columnar form returned by
+    read_images_binary_columnar."""
+    images = list(images.values())
+    points2D_offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(
+        [len(img.point3D_ids) for img in images], out=points2D_offsets[1:]
+    )
+    return {
+        "id": np.array([img.id for img in images], dtype=np.int32),
+        "qvec": np.array(
+            [img.qvec for img in images], dtype=np.float64
+        ).reshape(-1, 4),
+        "tvec": np.array(
+            [img.tvec for img in images], dtype=np.float64
+        ).reshape(-1, 3),
+        "camera_id": np.array(
+            [img.camera_id for img in images], dtype=np.int32
+        ),
+        "name": [img.name for img in images],
+        "points2D_offsets": points2D_offsets,
+        "xys": np.concatenate(
+            [np.empty((0, 2))]
+            + [np.reshape(img.xys, (-1, 2)) for img in images]
+        ).astype(np.float64),
+        "point3D_ids": np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [np.asarray(img.point3D_ids, dtype=np.int64) for img in images]
+        ),
+    }
+
+
+def images_from_columns(columns):
+    """Inverse of images_to_columns, returns a dict of Image namedtuples
+    whose arrays are views into the columns."""
+    points2D_offsets = columns["points2D_offsets"]
+    xys = _split_rows(columns["xys"], points2D_offsets)
+    point3D_ids = _split_rows(columns["point3D_ids"], points2D_offsets)
+    images = {}
+    for i, image_id in enumerate(columns["id"].tolist()):
+        images[image_id] = Image(
+            id=image_id,
+            qvec=columns["qvec"][i],
+            tvec=columns["tvec"][i],
+            camera_id=int(columns["camera_id"][i]),
+            name=columns["name"][i],
+            xys=xys[i],
+            point3D_ids=point3D_ids[i],
+        )
+    return images
+
+
+def points3D_to_columns(points3D):
+    """Stack a dict of Point3D namedtuples into the columnar form returned
+    by read_points3D_binary_columnar."""
+    points3D = list(points3D.values())
+    track_offsets = np.zeros(len(points3D) + 1, dtype=np.int64)
+    np.cumsum([len(pt.image_ids) for pt in points3D], out=track_offsets[1:])
+    return {
+        "id": np.array([pt.id for pt in points3D], dtype=np.uint64),
+        "xyz": np.array(
+            [pt.xyz for pt in points3D], dtype=np.float64
+        ).reshape(-1, 3),
+        "rgb": np.array([pt.rgb for pt in points3D], dtype=np.uint8).reshape(
+            -1, 3
+        ),
+        "error": np.array([pt.error for pt in points3D], dtype=np.float64),
+        "track_offsets": track_offsets,
+        "image_ids": np.concatenate(
+            [np.empty(0, dtype=np.int32)]
+            + [np.asarray(pt.image_ids, dtype=np.int32) for pt in points3D]
+        ),
+        "point2D_idxs": np.concatenate(
+            [np.empty(0, dtype=np.int32)]
+            + [np.asarray(pt.point2D_idxs, dtype=np.int32) for pt in points3D]
+        ),
+    }
+
+
+def points3D_from_columns(columns):
+    """Inverse of points3D_to_columns, returns a dict of Point3D namedtuples
+    whose arrays are views into the columns."""
+    track_offsets = columns["track_offsets"]
+    image_ids = _split_rows(
+        columns["image_ids"].astype(np.int64), track_offsets
+    )
+    point2D_idxs = _split_rows(
+        columns["point2D_idxs"].astype(np.int64), track_offsets
+    )
+    points3D = {}
+    for point3D_id, xyz, rgb, error, track_image_ids, track_point2D_idxs in zip(
+        columns["id"].tolist(),
+        list(columns["xyz"]),
+        list(columns["rgb"].astype(np.int64)),
+        list(columns["error"]),
+        image_ids,
+        point2D_idxs,
+    ):
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=xyz,
+            rgb=rgb,
+            error=error,
+            image_ids=track_image_ids,
+            point2D_idxs=track_point2D_idxs,
+        )
+    return points3D
+
+
+def read_images_binary_columnar(path_to_model_file):
     """
+    Columnar variant of read_images_binary. The file is read once and every
+    record is decoded with np.frombuffer, the 2D points of all images are
+    concatenated into CSR-style arrays.
+
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
+
+    :return: dict with "id" (M,), "qvec" (M, 4), "tvec" (M, 3),
+        "camera_id" (M,), "name" (list of M str), "points2D_offsets" (M+1,),
+        "xys" (P, 2) and "point3D_ids" (P,). The 2D points of the i-th image
+        are the rows points2D_offsets[i]:points2D_offsets[i+1].
     """
-    images = {}
     with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi"
+        data = fid.read()
+
+    num_reg_images = struct.unpack_from("<Q", data, 0)[0]
+    headers = np.empty(num_reg_images, dtype=IMAGE_HEADER_DTYPE)
+    names = []
+    points2D = []
+    offset = 8
+    for i in range(num_reg_images):
+        headers[i] = np.frombuffer(
+            data, dtype=IMAGE_HEADER_DTYPE, count=1, offset=offset
+        )[0]
+        name_start = offset + IMAGE_HEADER_DTYPE.itemsize
+        name_end = data.index(b"\x00", name_start)  # look for the ASCII 0 entry
+        names.append(data[name_start:name_end].decode("utf-8"))
+        num_points2D = struct.unpack_from("<Q", data, name_end + 1)[0]
+        offset = name_end + 9
+        points2D.append(
+            np.frombuffer(
+                data, dtype=POINT2D_DTYPE, count=num_points2D, offset=offset
             )
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            binary_image_name = b""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                binary_image_name += current_char
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            image_name = binary_image_name.decode("utf-8")
-            num_points2D = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            x_y_id_s = read_next_bytes(
-                fid,
-                num_bytes=24 * num_points2D,
-                format_char_sequence="ddq" * num_points2D,
-            )
-            xys = np.column_stack(
-                [
-                    tuple(map(float, x_y_id_s[0::3])),
-                    tuple(map(float, x_y_id_s[1::3])),
-                ]
-            )
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
-            )
-    return images
+        )
+        offset += POINT2D_DTYPE.itemsize * num_points2D
+    if offset != len(data):
+        raise ValueError(
+            f"{path_to_model_file}: parsed {offset} bytes, file has {len(data)} bytes"
+        )
+
+    points2D_offsets = np.zeros(num_reg_images + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in points2D], out=points2D_offsets[1:])
+    points2D = (
+        np.concatenate(points2D)
+        if num_reg_images > 0
+        else np.empty(0, dtype=POINT2D_DTYPE)
+    )
+    return {
+        "id": np.ascontiguousarray(headers["id"]),
+        "qvec": np.ascontiguousarray(headers["qvec"]),
+        "tvec": np.ascontiguousarray(headers["tvec"]),
+        "camera_id": np.ascontiguousarray(headers["camera_id"]),
+        "name": names,
+        "points2D_offsets": points2D_offsets,
+        "xys": np.ascontiguousarray(points2D["xy"]),
+        "point3D_ids": np.ascontiguousarray(points2D["point3D_id"]),
+    }
+
+
+def read_images_binary(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    return images_from_columns(read_images_binary_columnar(path_to_model_file))
 
 
 def write_images_text(images, path):
@@ -334,25 +506,53 @@ def write_images_text(images, path):
             fid.write(" ".join(points_strings) + "\n")
 
 
-def write_images_binary(images, path_to_model_file):
+def write_images_binary_columnar(columns, path_to_model_file):
     """
+    Columnar variant of write_images_binary. Every image record is packed
+    with structured arrays and written with a single call.
+
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
+
+    :param columns: Images in the form returned by read_images_binary_columnar
     """
+    num_images = len(columns["id"])
+    headers = np.empty(num_images, dtype=IMAGE_HEADER_DTYPE)
+    headers["id"] = columns["id"]
+    headers["qvec"] = columns["qvec"]
+    headers["tvec"] = columns["tvec"]
+    headers["camera_id"] = columns["camera_id"]
+
+    points2D = np.empty(len(columns["point3D_ids"]), dtype=POINT2D_DTYPE)
+    points2D["xy"] = columns["xys"]
+    points2D["point3D_id"] = columns["point3D_ids"]
+
+    offsets = columns["points2D_offsets"].tolist()
     with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(images), "Q")
-        for _, img in images.items():
-            write_next_bytes(fid, img.id, "i")
-            write_next_bytes(fid, img.qvec.tolist(), "dddd")
-            write_next_bytes(fid, img.tvec.tolist(), "ddd")
-            write_next_bytes(fid, img.camera_id, "i")
-            for char in img.name:
-                write_next_bytes(fid, char.encode("utf-8"), "c")
-            write_next_bytes(fid, b"\x00", "c")
-            write_next_bytes(fid, len(img.point3D_ids), "Q")
-            for xy, p3d_id in zip(img.xys, img.point3D_ids):
-                write_next_bytes(fid, [*xy, p3d_id], "ddq")
+        write_next_bytes(fid, num_images, "Q")
+        for i in range(num_images):
+            start, end = offsets[i], offsets[i + 1]
+            fid.write(
+                b"".join(
+                    [
+                        headers[i : i + 1].tobytes(),
+                        columns["name"][i].encode("utf-8"),
+                        b"\x00",
+                        struct.pack("<Q", end - start),
+                        points2D[start:end].tobytes(),
+                    ]
+                )
+            )
+
+
+def write_images_binary(images, path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    write_images_binary_columnar(images_to_columns(images), path_to_model_file)
 
 
 def read_points3D_text(path):
@@ -387,42 +587,72 @@ def read_points3D_text(path):
     return points3D
 
 
-def read_points3D_binary(path_to_model_file):
+def read_points3D_binary_columnar(path_to_model_file):
     """
+    Columnar variant of read_points3D_binary. The file is read once, only the
+    record boundaries are located with a scan over the track lengths, the
+    fixed-size point headers and the tracks are then decoded in bulk with
+    np.frombuffer.
+
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
+
+    :return: dict with "id" (N,), "xyz" (N, 3), "rgb" (N, 3), "error" (N,),
+        "track_offsets" (N+1,), "image_ids" (T,) and "point2D_idxs" (T,). The
+        track of the i-th point are the entries
+        track_offsets[i]:track_offsets[i+1].
     """
-    points3D = {}
     with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd"
-            )
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q"
-            )[0]
-            track_elems = read_next_bytes(
-                fid,
-                num_bytes=8 * track_length,
-                format_char_sequence="ii" * track_length,
-            )
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id,
-                xyz=xyz,
-                rgb=rgb,
-                error=error,
-                image_ids=image_ids,
-                point2D_idxs=point2D_idxs,
-            )
-    return points3D
+        data = fid.read()
+
+    num_points = struct.unpack_from("<Q", data, 0)[0]
+    header_size = POINT3D_HEADER_DTYPE.itemsize
+    track_length_offset = POINT3D_HEADER_DTYPE.fields["track_length"][1]
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    starts = []
+    offset = 8
+    for _ in range(num_points):
+        starts.append(offset)
+        track_length = unpack_track_length(
+            data, offset + track_length_offset
+        )[0]
+        offset += header_size + TRACK_ELEM_DTYPE.itemsize * track_length
+    if offset != len(data):
+        raise ValueError(
+            f"{path_to_model_file}: parsed {offset} bytes, file has {len(data)} bytes"
+        )
+
+    # Everything behind the leading point count is either a point header or
+    # a track element, so a mask over the header bytes splits the two.
+    raw = np.frombuffer(data, dtype=np.uint8, offset=8)
+    starts = np.asarray(starts, dtype=np.int64) - 8
+    is_header = _span_mask(raw.size, starts, header_size)
+    headers = raw[is_header].view(POINT3D_HEADER_DTYPE)
+    tracks = raw[~is_header].view(TRACK_ELEM_DTYPE)
+
+    track_offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(headers["track_length"], out=track_offsets[1:])
+    return {
+        "id": np.ascontiguousarray(headers["id"]),
+        "xyz": np.ascontiguousarray(headers["xyz"]),
+        "rgb": np.ascontiguousarray(headers["rgb"]),
+        "error": np.ascontiguousarray(headers["error"]),
+        "track_offsets": track_offsets,
+        "image_ids": np.ascontiguousarray(tracks["image_id"]),
+        "point2D_idxs": np.ascontiguousarray(tracks["point2D_idx"]),
+    }
+
+
+def read_points3D_binary(path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    return points3D_from_columns(
+        read_points3D_binary_columnar(path_to_model_file)
+    )
 
 
 def write_points3D_text(points3D, path):
@@ -456,23 +686,67 @@ def write_points3D_text(points3D, path):
             fid.write(" ".join(track_strings) + "\n")
 
 
-def write_points3D_binary(points3D, path_to_model_file):
+def write_points3D_binary_columnar(
+    columns, path_to_model_file, chunk_size=1 << 20
+):
     """
+    Columnar variant of write_points3D_binary. Points are written in blocks
+    of chunk_size: the headers and tracks of a block are packed into
+    structured arrays, interleaved into one buffer and written at once.
+
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
+
+    :param columns: Points in the form returned by
+        read_points3D_binary_columnar
+    :param chunk_size: Number of points packed per write
     """
+    num_points = len(columns["id"])
+    track_offsets = np.asarray(columns["track_offsets"], dtype=np.int64)
+    header_size = POINT3D_HEADER_DTYPE.itemsize
     with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(points3D), "Q")
-        for _, pt in points3D.items():
-            write_next_bytes(fid, pt.id, "Q")
-            write_next_bytes(fid, pt.xyz.tolist(), "ddd")
-            write_next_bytes(fid, pt.rgb.tolist(), "BBB")
-            write_next_bytes(fid, pt.error, "d")
-            track_length = pt.image_ids.shape[0]
-            write_next_bytes(fid, track_length, "Q")
-            for image_id, point2D_id in zip(pt.image_ids, pt.point2D_idxs):
-                write_next_bytes(fid, [image_id, point2D_id], "ii")
+        write_next_bytes(fid, num_points, "Q")
+        for begin in range(0, num_points, chunk_size):
+            end = min(begin + chunk_size, num_points)
+            headers = np.empty(end - begin, dtype=POINT3D_HEADER_DTYPE)
+            headers["id"] = columns["id"][begin:end]
+            headers["xyz"] = columns["xyz"][begin:end]
+            headers["rgb"] = columns["rgb"][begin:end]
+            headers["error"] = columns["error"][begin:end]
+            headers["track_length"] = np.diff(track_offsets[begin : end + 1])
+
+            track_begin, track_end = track_offsets[begin], track_offsets[end]
+            tracks = np.empty(track_end - track_begin, dtype=TRACK_ELEM_DTYPE)
+            tracks["image_id"] = columns["image_ids"][track_begin:track_end]
+            tracks["point2D_idx"] = columns["point2D_idxs"][
+                track_begin:track_end
+            ]
+
+            # Record k starts after the k previous headers and their tracks
+            starts = (
+                np.arange(end - begin) * header_size
+                + (track_offsets[begin:end] - track_begin)
+                * TRACK_ELEM_DTYPE.itemsize
+            )
+            block = np.empty(
+                headers.nbytes + tracks.nbytes, dtype=np.uint8
+            )
+            is_header = _span_mask(block.size, starts, header_size)
+            block[is_header] = headers.view(np.uint8)
+            block[~is_header] = tracks.view(np.uint8)
+            fid.write(block)
+
+
+def write_points3D_binary(points3D, path_to_model_file):
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    write_points3D_binary_columnar(
+        points3D_to_columns(points3D), path_to_model_file
+    )
 
 
 def detect_model_format(path, ext):
@@ -563,6 +837,56 @@ def rotmat2qvec(R):
     return qvec
 
 
+def qvecs2rotmats(qvecs):
+    """Array version of qvec2rotmat.
+    :param qvecs: Quaternions of shape (..., 4)
+    :return: Rotation matrices of shape (..., 3, 3)
+    """
+    qvecs = np.asarray(qvecs, dtype=np.float64)
+    w, x, y, z = np.moveaxis(qvecs, -1, 0)
+    R = np.empty(qvecs.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1 - 2 * y**2 - 2 * z**2
+    R[..., 0, 1] = 2 * x * y - 2 * w * z
+    R[..., 0, 2] = 2 * z * x + 2 * w * y
+    R[..., 1, 0] = 2 * x * y + 2 * w * z
+    R[..., 1, 1] = 1 - 2 * x**2 - 2 * z**2
+    R[..., 1, 2] = 2 * y * z - 2 * w * x
+    R[..., 2, 0] = 2 * z * x - 2 * w * y
+    R[..., 2, 1] = 2 * y * z + 2 * w * x
+    R[..., 2, 2] = 1 - 2 * x**2 - 2 * y**2
+    return R
+
+
+def rotmats2qvecs(R):
+    """Array version of rotmat2qvec. All symmetric 4x4 matrices are solved
+    with one stacked eigh call, so the result matches rotmat2qvec.
+    :param R: Rotation matrices of shape (..., 3, 3)
+    :return: Quaternions of shape (..., 4) with non-negative real part
+    """
+    R = np.asarray(R, dtype=np.float64)
+    Rxx, Ryx, Rzx = R[..., 0, 0], R[..., 0, 1], R[..., 0, 2]
+    Rxy, Ryy, Rzy = R[..., 1, 0], R[..., 1, 1], R[..., 1, 2]
+    Rxz, Ryz, Rzz = R[..., 2, 0], R[..., 2, 1], R[..., 2, 2]
+    K = np.zeros(R.shape[:-2] + (4, 4))
+    K[..., 0, 0] = Rxx - Ryy - Rzz
+    K[..., 1, 0] = Ryx + Rxy
+    K[..., 1, 1] = Ryy - Rxx - Rzz
+    K[..., 2, 0] = Rzx + Rxz
+    K[..., 2, 1] = Rzy + Ryz
+    K[..., 2, 2] = Rzz - Rxx - Ryy
+    K[..., 3, 0] = Ryz - Rzy
+    K[..., 3, 1] = Rzx - Rxz
+    K[..., 3, 2] = Rxy - Ryx
+    K[..., 3, 3] = Rxx + Ryy + Rzz
+    K /= 3.0
+    eigvals, eigvecs = np.linalg.eigh(K)
+    index = np.argmax(eigvals, axis=-1)[..., np.newaxis, np.newaxis]
+    qvecs = np.take_along_axis(eigvecs, index, axis=-1)[..., 0]
+    qvecs = qvecs[..., [3, 0, 1, 2]]
+    qvecs[qvecs[..., 0] < 0] *= -1
+    return qvecs
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Read and write COLMAP binary and text models"
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+import os
+
+import numpy as np
+
+from .read_write_model import (
+    detect_model_format,
+    images_from_columns,
+    images_to_columns,
+    points3D_from_columns,
+    points3D_to_columns,
+    read_cameras_binary,
+    read_images_binary_columnar,
+    read_model,
+    read_points3D_binary_columnar,
+    write_cameras_binary,
+    write_images_binary_columnar,
+    write_model,
+    write_points3D_binary_columnar,
+)
+
+
+class Reconstruction:
+    def __init__(self, cameras: dict, image_columns: dict, point_columns: dict):
+        """
+        Struct-of-arrays container for a COLMAP reconstruction. Instead of one Image/Point3D namedtuple per entry
+        (each holding tiny arrays) all images and points are stored in contiguous arrays, so transformations can be
+        applied to the whole model with a single matrix operation.
+
+            Images (M):     image_ids (M,), qvec (M, 4), tvec (M, 3), camera_ids (M,), names (M,)
+            2D points (P):  points2D_offsets (M+1,), xys (P, 2), point3D_ids (P,)
+            Points (N):     point_ids (N,), xyz (N, 3), rgb (N, 3), error (N,)
+            Tracks (T):     track_offsets (N+1,), track_image_ids (T,), track_point2D_idxs (T,)
+
+        The 2D points of image row i are xys[points2D_offsets[i]:points2D_offsets[i + 1]] and the track of point
+        row j is track_image_ids[track_offsets[j]:track_offsets[j + 1]]. Cameras stay a dict of Camera namedtuples.
+
+        :param cameras: Dict of Camera namedtuples
+        :param image_columns: Images in the form returned by read_images_binary_columnar
+        :param point_columns: Points in the form returned by read_points3D_binary_columnar
+        """
+        self.cameras = cameras
+
+        self.image_ids = image_columns["id"]
+        self.qvec = image_columns["qvec"]
+        self.tvec = image_columns["tvec"]
+        self.camera_ids = image_columns["camera_id"]
+        self.names = list(image_columns["name"])
+        self.points2D_offsets = image_columns["points2D_offsets"]
+        self.xys = image_columns["xys"]
+        self.point3D_ids = image_columns["point3D_ids"]
+
+        self.point_ids = point_columns["id"]
+        self.xyz = point_columns["xyz"]
+        self.rgb = point_columns["rgb"]
+        self.error = point_columns["error"]
+        self.track_offsets = point_columns["track_offsets"]
+        self.track_image_ids = point_columns["image_ids"]
+        self.track_point2D_idxs = point_columns["point2D_idxs"]
+
+        # Sort orders of the ids, built on first lookup
+        self.__image_order = None
+        self.__point_order = None
+
+    @classmethod
+    def read(cls, path: str, ext: str = "") -> "Reconstruction":
+        """
+        Reads a COLMAP model folder. Binary models are decoded directly into arrays, text models are parsed with
+        read_model and stacked afterwards.
+
+        :param path: Path to the folder containing cameras, images and points3D
+        :param ext: '.bin' or '.txt'. Detected automatically if empty
+        :return: Reconstruction
+        """
+        if ext == "":
+            ext = ".bin" if detect_model_format(path, ".bin") else ".txt"
+
+        if ext == ".bin":
+            return cls(
+                cameras=read_cameras_binary(os.path.join(path, "cameras" + ext)),
+                image_columns=read_images_binary_columnar(os.path.join(path, "images" + ext)),
+                point_columns=read_points3D_binary_columnar(os.path.join(path, "points3D" + ext)),
+            )
+
+        return cls.from_dicts(*read_model(path, ext))
+
+    @classmethod
+    def from_dicts(cls, cameras: dict, images: dict, points3D: dict) -> "Reconstruction":
+        """
+        Builds a Reconstruction from the dicts returned by read_model.
+        """
+        return cls(cameras=cameras,
+                   image_columns=images_to_columns(images),
+                   point_columns=points3D_to_columns(points3D))
+
+    def to_dicts(self):
+        """
+        Converts back to the (cameras, images, points3D) dicts of namedtuples used by read_model/write_model. The
+        arrays of the namedtuples are views into this reconstruction.
+        """
+        return self.cameras, images_from_columns(self.image_columns()), points3D_from_columns(self.point_columns())
+
+    def image_columns(self) -> dict:
+        return {
+            "id": self.image_ids,
+            "qvec": self.qvec,
+            "tvec": self.tvec,
+            "camera_id": self.camera_ids,
+            "name": self.names,
+            "points2D_offsets": self.points2D_offsets,
+            "xys": self.xys,
+            "point3D_ids": self.point3D_ids,
+        }
+
+    def point_columns(self) -> dict:
+        return {
+            "id": self.point_ids,
+            "xyz": self.xyz,
+            "rgb": self.rgb,
+            "error": self.error,
+            "track_offsets": self.track_offsets,
+            "image_ids": self.track_image_ids,
+            "point2D_idxs": self.track_point2D_idxs,
+        }
+
+    def write(self, path: str, ext: str = ".bin"):
+        """
+        Writes the reconstruction as COLMAP model into path. Binary models are packed directly from the arrays.
+        """
+        if ext == ".bin":
+            write_cameras_binary(self.cameras, os.path.join(path, "cameras" + ext))
+            write_images_binary_columnar(self.image_columns(), os.path.join(path, "images" + ext))
+            write_points3D_binary_columnar(self.point_columns(), os.path.join(path, "points3D" + ext))
+        else:
+            write_model(*self.to_dicts(), path=path, ext=ext)
+
+    @property
+    def num_images(self) -> int:
+        return len(self.image_ids)
+
+    @property
+    def num_points(self) -> int:
+        return len(self.point_ids)
+
+    @property
+    def track_lengths(self) -> np.ndarray:
+        return np.diff(self.track_offsets)
+
+    def image_rows(self, image_ids) -> np.ndarray:
+        """
+        Maps image ids to row indices of the image arrays.
+
+        :param image_ids: Scalar or array of image ids
+        :return: Row indices with the shape of image_ids
+        """
+        if self.__image_order is None:
+            self.__image_order = np.argsort(self.image_ids, kind="stable")
+        return self.__lookup(self.image_ids, self.__image_order, image_ids)
+
+    def point_rows(self, point_ids) -> np.ndarray:
+        """
+        Maps 3D point ids to row indices of the point arrays.
+
+        :param point_ids: Scalar or array of point ids
+        :return: Row indices with the shape of point_ids
+        """
+        if self.__point_order is None:
+            self.__point_order = np.argsort(self.point_ids, kind="stable")
+        return self.__lookup(self.point_ids, self.__point_order, point_ids)
+
+    @staticmethod
+    def __lookup(ids: np.ndarray, order: np.ndarray, query) -> np.ndarray:
+        query = np.asarray(query)
+        # Negative ids (e.g. the COLMAP sentinel -1) would wrap around in the cast to unsigned point ids
+        if query.size > 0 and np.any(query < 0):
+            raise ValueError(f"Invalid negative id: {query[query < 0].flat[0].item()}")
+        query = query.astype(ids.dtype)
+        if len(ids) == 0:
+            if query.size > 0:
+                raise KeyError(query.flat[0].item())
+            return np.zeros(query.shape, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(ids, query, sorter=order), len(ids) - 1)
+        rows = order[positions]
+        missing = ids[rows] != query
+        if np.any(missing):
+            raise KeyError(query[missing].flat[0].item())
+        return rows
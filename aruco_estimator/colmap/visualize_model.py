@@ -32,7 +32,7 @@ import argparse
 import numpy as np
 import open3d
 
-from aruco_estimator.colmap.read_write_model import qvec2rotmat, read_model
+from aruco_estimator.colmap.read_write_model import qvecs2rotmats, read_model
 
 
 class Model:
@@ -90,10 +90,12 @@ class Model:
             color: RGB color for camera planes and lines
         """
         frames = []
-        for img in self.images.values():
-            # rotation
-            R = qvec2rotmat(img.qvec)
-
+        images = list(self.images.values())
+        # rotations of all images at once
+        rotations = qvecs2rotmats([img.qvec for img in images]).reshape(
+            -1, 3, 3
+        )
+        for img, R in zip(images, rotations):
             # translation
             t = img.tvec
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+# Built-in/Generic Imports
+import logging
+import os
+import sqlite3
+from typing import List
+
+# Libs
+import numpy as np
+
+
+class DetectionCache:
+    def __init__(self, path: str):
+        """
+        Persistent cache of ArUco detections stored in a single SQLite file. Every image keeps one row per detector
+        configuration holding the raw result of detect_aruco_marker (corners, ids and image size). A row is only
+        reused while the modification time and size of the image file are unchanged.
+
+        :param path: Path to the SQLite file, created if it does not exist
+        """
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            "path TEXT NOT NULL, detector TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "height INTEGER NOT NULL, width INTEGER NOT NULL, ids BLOB, corners BLOB, "
+            "PRIMARY KEY (path, detector))")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def detector_key(dict_type: int, reduction: int = 1) -> str:
+        """
+        Identifies the detector configuration. Detections made with another configuration are never reused.
+        """
+        return f"dict_type={dict_type};reduction={reduction}"
+
+    @staticmethod
+    def __file_signature(image_path: str):
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, image_paths: List[str], detector: str) -> list:
+        """
+        Looks up the detections of the given images.
+
+        :param image_paths: Paths of the images
+        :param detector: Detector configuration, see detector_key
+        :return: List with the result of detect_aruco_marker for every unchanged image and None for all others
+        """
+        rows = {row[0]: row[1:] for row in self.connection.execute(
+            "SELECT path, mtime_ns, size, height, width, ids, corners FROM detections WHERE detector = ?",
+            (detector,))}
+
+        results = []
+        for image_path in image_paths:
+            row = rows.get(os.path.abspath(image_path))
+            if row is None or row[:2] != self.__file_signature(image_path):
+                results.append(None)
+                continue
+
+            mtime_ns, size, height, width, ids, corners = row
+            if ids is None:
+                results.append((None, None, (height, width)))
+            else:
+                ids = np.frombuffer(ids, dtype=np.int32).reshape(-1, 1)
+                corners = tuple(np.frombuffer(corners, dtype=np.float32).reshape(-1, 1, 4, 2))
+                results.append((corners, ids, (height, width)))
+        return results
+
+    def put(self, image_paths: List[str], results: list, detector: str):
+        """
+        Stores the detections of the given images. Failed loads (results without image size) are not stored.
+
+        :param image_paths: Paths of the images
+        :param results: Results of detect_aruco_marker in the order of image_paths
+        :param detector: Detector configuration, see detector_key
+        """
+        rows = []
+        for image_path, result in zip(image_paths, results):
+            signature = self.__file_signature(image_path)
+            if signature is None or len(result) < 3:
+                continue
+            corners, ids, image_size = result
+            if ids is not None:
+                ids = np.ascontiguousarray(ids, dtype=np.int32).tobytes()
+                corners = np.ascontiguousarray(np.asarray(corners), dtype=np.float32).tobytes()
+            rows.append((os.path.abspath(image_path), detector, *signature, int(image_size[0]), int(image_size[1]),
+                         ids, corners))
+
+        self.connection.executemany("INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+        logging.debug(f"Stored {len(rows)} detections in {self.path}")
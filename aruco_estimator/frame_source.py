@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+# Built-in/Generic Imports
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
+# Libs
+import cv2
+from tqdm import tqdm
+
+from .aruco import detect_aruco_marker_in_image_worker, init_detection_worker
+
+
+class FrameSource(ABC):
+    """
+    Source of the images the markers are detected in, used by ArucoLocalizer instead of reading the image files of
+    the COLMAP project.
+    """
+
+    @abstractmethod
+    def detect(self, image_names: List[str], dict_type: int, reduction: int = 1, num_workers: int = None,
+               progress_bar: bool = True) -> list:
+        """
+        Detects the markers in the frames belonging to the given COLMAP images.
+
+        :param image_names: Names of the COLMAP images
+        :param dict_type: Predefined aruco dictionary
+        :param reduction: Detection reduction, see detect_aruco_marker
+        :param num_workers: Number of detection threads. Defaults to the number of CPUs
+        :param progress_bar: Show a progress bar
+        :return: Results of detect_aruco_marker in the order of image_names, (None, None) if there is no frame
+        """
+
+
+class VideoFrameSource(FrameSource):
+    def __init__(self, video_path: str, stride: int = 1, index_offset: int = 1,
+                 frame_indices: Dict[str, int] = None):
+        """
+        Reads the frames of the COLMAP images directly from the video they were extracted from. The video is decoded
+        once sequentially, frames without COLMAP image are skipped with grab() and the markers are detected in a
+        thread pool while decoding continues.
+
+        Images are matched to frames by the last number in their name, e.g. frame_000042.jpg. With frames extracted
+        every stride frames and numbered from index_offset, the image numbered i is frame (i - index_offset) * stride.
+
+        :param video_path: Path to the video file
+        :param stride: Number of video frames between two extracted images
+        :param index_offset: Number of the first extracted image (ffmpeg starts at 1)
+        :param frame_indices: Explicit mapping from image name to frame index, overrides the name matching
+        """
+        self.video_path = str(video_path)
+        self.stride = stride
+        self.index_offset = index_offset
+        self.frame_indices = frame_indices
+
+    def frame_index(self, image_name: str) -> Union[int, None]:
+        """
+        Frame index of a COLMAP image, None if it cannot be matched.
+        """
+        if self.frame_indices is not None:
+            return self.frame_indices.get(image_name)
+
+        match = re.search(r"(\d+)\D*$", os.path.splitext(os.path.basename(image_name))[0])
+        if match is None:
+            return None
+        return (int(match.group(1)) - self.index_offset) * self.stride
+
+    def detect(self, image_names: List[str], dict_type: int, reduction: int = 1, num_workers: int = None,
+               progress_bar: bool = True) -> list:
+        results = [(None, None)] * len(image_names)
+
+        # Positions in image_names of every requested frame
+        wanted = {}
+        for position, image_name in enumerate(image_names):
+            frame_index = self.frame_index(image_name)
+            if frame_index is None or frame_index < 0:
+                logging.warning(f"No video frame for image: {image_name}")
+                continue
+            wanted.setdefault(frame_index, []).append(position)
+        if not wanted:
+            return results
+
+        capture = cv2.VideoCapture(self.video_path)
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video: {self.video_path}")
+
+        num_workers = num_workers or os.cpu_count()
+        pending = deque()
+
+        def collect():
+            frame_index, future = pending.popleft()
+            for position in wanted[frame_index]:
+                results[position] = future.result()
+            progress.update()
+
+        try:
+            with ThreadPoolExecutor(num_workers, initializer=init_detection_worker,
+                                    initargs=(dict_type, reduction)) as executor, \
+                    tqdm(total=len(wanted), disable=not progress_bar) as progress:
+                for frame_index in range(max(wanted) + 1):
+                    if frame_index not in wanted:
+                        if not capture.grab():
+                            break
+                        continue
+
+                    success, frame = capture.read()
+                    if not success:
+                        break
+                    pending.append((frame_index, executor.submit(detect_aruco_marker_in_image_worker, frame)))
+
+                    # Bound the decoded frames waiting for detection
+                    while len(pending) > 2 * num_workers:
+                        collect()
+
+                while pending:
+                    collect()
+        finally:
+            capture.release()
+
+        missing = sum(1 for result in results if len(result) < 3)
+        if missing:
+            logging.warning(f"{missing} of {len(image_names)} images have no frame in {self.video_path}")
+        return results
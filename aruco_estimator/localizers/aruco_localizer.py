@@ -8,30 +8,30 @@ See LICENSE file for more information.
 import logging
 import os
 import time
-from copy import deepcopy
-from functools import partial, wraps
-from multiprocessing import Pool
+from copy import copy
+from functools import wraps
 from typing import Tuple, Union
 
 import cv2
+import matplotlib.pyplot as plt
 import numpy as np
 import open3d as o3d
 from colmap_wrapper.colmap import COLMAP, COLMAPProject
-from colmap_wrapper.colmap.bin import (
-    write_cameras_text,
-    write_images_text,
-    write_points3D_text,
-)
 from colmap_wrapper.colmap.utils import generate_colmap_sparse_pc
-from tqdm import tqdm
 
-from ..aruco import detect_aruco_marker, ray_cast_aruco_corners
+from ..aruco import detect_aruco_markers, ray_cast_aruco_corners_batched
+from ..colmap.pose_source import PoseSource
+from ..colmap.read_write_model import CAMERA_MODEL_NAMES, write_model
+from ..detection_cache import DetectionCache
 from ..opt import (
+    IncrementalIntersector,
     intersect,
     intersect_parallelized,
+    intersect_robust,
     ls_intersection_of_lines,
     ls_intersection_of_lines_parallelized,
 )
+from ..tools.ply_transform import transform_ply
 from .base import LocalizerBase
 
 
@@ -48,8 +48,61 @@ def timeit(func):
     return timeit_wrapper
 
 
+def scale_records(records: dict, field: str, scale: float, in_place: bool = False) -> dict:
+    """
+    Scales one array attribute (e.g. xyz of sparse points or tvec of images) of all records with a single array
+    operation. Without in_place the returned records are shallow copies which share all other attributes with the
+    originals. Works with namedtuples (read_model) and mutable objects (colmap_wrapper).
+
+    :param records: Dict of records
+    :param field: Name of the attribute to scale
+    :param scale: Scale factor
+    :param in_place: Update the records (and the dict) itself
+    :return: Dict with the scaled records
+    """
+    scaled = records if in_place else {}
+    if len(records) == 0:
+        return scaled
+
+    values = np.array([getattr(record, field) for record in records.values()]) * scale
+    for (key, record), value in zip(list(records.items()), values):
+        if hasattr(record, '_replace'):
+            record = record._replace(**{field: value})
+        else:
+            if not in_place:
+                record = copy(record)
+            setattr(record, field, value)
+        scaled[key] = record
+    return scaled
+
+
+def colmap_cameras(cameras: dict) -> dict:
+    """
+    Cameras with the parameter layout of their COLMAP model. colmap_wrapper stores SIMPLE_RADIAL and PINHOLE cameras
+    as [fx, fy, cx, cy, k1], which has to be mapped back before the cameras are written as COLMAP model.
+
+    :param cameras: Dict of cameras (read_model or colmap_wrapper)
+    :return: Dict of cameras with COLMAP parameters
+    """
+    converted = {}
+    for camera_id, camera in cameras.items():
+        params = np.asarray(camera.params)
+        num_params = CAMERA_MODEL_NAMES[camera.model].num_params
+        if len(params) != num_params:
+            if camera.model == 'SIMPLE_RADIAL' and len(params) == 5:
+                params = params[[0, 2, 3, 4]]
+            elif camera.model == 'PINHOLE' and len(params) == 5:
+                params = params[:4]
+            else:
+                raise ValueError(f"Camera {camera_id} has {len(params)} params, "
+                                 f"model {camera.model} expects {num_params}")
+            camera = camera._replace(params=params)
+        converted[camera_id] = camera
+    return converted
+
+
 class ArucoLocalizer(LocalizerBase):
-    def __init__(self, photogrammetry_software: Union[COLMAPProject, COLMAP], aruco_size: float,
+    def __init__(self, photogrammetry_software: Union[COLMAPProject, COLMAP, PoseSource], aruco_size: float,
                  dense_path: str = 'fused.ply', dict_type: int = cv2.aruco.DICT_4X4_50, target_id: int = 0):
         """
         This class is used to determine 3D points of the aruco marker, which are used to compute a scaling factor.
@@ -74,7 +127,8 @@ class ArucoLocalizer(LocalizerBase):
                 | LS for Interection of Lines |
                 -------------------------------
 
-        :param photogrammetry_software: COLMAP project or instance
+        :param photogrammetry_software: COLMAP project or instance. A PoseSource is enough if only the marker
+            positions are needed, it skips loading the dense point cloud and the images
         :param aruco_size: Size of the ArUco marker in meters
         :param dense_path: Path to dense point cloud
         :param dict_type: ArUco dictionary type
@@ -87,8 +141,8 @@ class ArucoLocalizer(LocalizerBase):
 
         # Values to calculate 3D point of intersection
         self.images_scaled = None
-        self.P0 = np.array([])
-        self.N = np.array([])
+        self.P0 = np.empty((0, 3))  # Ray origins (K, 3) of the target ID
+        self.N = np.empty((0, 4, 3))  # Normalized ray directions (K, 4, 3) of the target ID
 
         # Aruco specific
         self.aruco_distance = None
@@ -98,8 +152,18 @@ class ArucoLocalizer(LocalizerBase):
         
         # Store all detected ArUco markers
         self.all_aruco_ids = []
+        # Flat table with one row per (image, marker) detection, see __detect
+        self.detection_image_ids = np.empty(0, dtype=int)  # COLMAP image ID (D,)
+        self.detection_aruco_ids = np.empty(0, dtype=int)  # ArUco ID (D,)
+        self.detection_corners = np.empty((0, 4, 2))  # Corners in COLMAP camera resolution (D, 4, 2)
         self.all_aruco_corners_3d = {}  # Dictionary mapping ArUco IDs to their 3D corner positions
 
+        # Robust intersection (see run)
+        self.robust = False
+        self.inlier_threshold = 0.01
+        self.view_residuals = {}  # ArUco ID -> mean angular residual (K,) of every view
+        self.view_inliers = {}  # ArUco ID -> inlier mask (K,) of every view
+
         # Results
         self.scale_factor = None
         self.dense_scaled = None
@@ -107,8 +171,19 @@ class ArucoLocalizer(LocalizerBase):
 
         # Multi Processing
         self.progress_bar = True
-        self.num_processes = 12 if os.cpu_count() > 12 else os.cpu_count()
-        logging.debug('Num process: %s', self.num_processes)
+        self.detection_backend = 'process'  # 'process', 'thread' or 'pipeline', see aruco.detect_aruco_markers
+        self.num_workers = os.cpu_count()
+        self.num_readers = 8  # I/O threads of the pipeline backend
+        self.prefetch = None  # Images read ahead by the pipeline backend, None: 2 * num_workers
+        logging.debug('Num workers: %s', self.num_workers)
+        self.chunksize = None  # Images per task, None: len(images) / (4 * num_workers)
+        self.decode_reduction = 1  # Detect on images downscaled to 1/2, 1/4 or 1/8 resolution (refined at full res)
+
+        # Read frames from here instead of the image files (e.g. VideoFrameSource), detections are not cached
+        self.frame_source = None
+
+        # Detections of unchanged images are reused from this file across runs, None disables the cache
+        self.detection_cache_path = self.photogrammetry_software._project_path.joinpath('aruco_detections.db')
         self.image_names = []
         # Prepare parsed data for multi processing
         for image_idx in self.photogrammetry_software.images.keys():
@@ -117,12 +192,18 @@ class ArucoLocalizer(LocalizerBase):
    
         self.aruco_size = aruco_size
 
-    def run(self) -> [np.ndarray, None]:
+    def run(self, robust: bool = False, inlier_threshold: float = 0.01) -> [np.ndarray, None]:
         """
         Starts the aruco extraction, ray casting and intersection of lines.
 
+        :param robust: Use RANSAC over views followed by a Huber IRLS refinement instead of plain least squares. The
+            mean angular residual and inlier mask of every view are stored in view_residuals and view_inliers
+        :param inlier_threshold: Mean angular residual in radians up to which a view counts as inlier (robust only)
         :return: Tuple of (aruco_distance, aruco_corners_3d) for the target ArUco marker
         """
+        self.robust = robust
+        self.inlier_threshold = inlier_threshold
+
         self.__detect()
         self.__ray_cast()
         
@@ -131,8 +212,7 @@ class ArucoLocalizer(LocalizerBase):
             raise ValueError(f"Target ArUco ID {self.target_id} not found in images. Available IDs: {self.all_aruco_ids}")
         
         # Calculate 3D corners for target ID
-        self.aruco_corners_3d = intersect_parallelized(P0=self.P0.reshape(len(self.P0) // 3, 3),
-                                                       N=self.N.reshape(len(self.N) // 12, 4, 3))
+        self.aruco_corners_3d = self.__intersect(self.target_id)
         self.aruco_distance = self.__evaluate(self.aruco_corners_3d)
         
         # Store the target corners in the dictionary
@@ -148,45 +228,61 @@ class ArucoLocalizer(LocalizerBase):
         """
         Detects the aruco corners in the image and extracts the aruco id. Afterwards the image, id and tuple of corners
         are saved into the Image class to parse the data through the algorithm. If no aruco marker is detected it
-        returns None.
+        returns None. Every marker of every image is kept in the flat detection table (detection_image_ids,
+        detection_aruco_ids, detection_corners), so each ID gets all of its observations.
 
         :return:
         """
-        with Pool(self.num_processes) as p:
-            result = list(tqdm(p.imap(
-                partial(detect_aruco_marker, dict_type=self.aruco_dict_type),
-                self.image_names), total=len(self.image_names), disable=not self.progress_bar))
-        
+        if self.frame_source is not None:
+            result = self.frame_source.detect(
+                [self.photogrammetry_software.images[image_idx].name
+                 for image_idx in self.photogrammetry_software.images.keys()],
+                dict_type=self.aruco_dict_type,
+                reduction=self.decode_reduction,
+                num_workers=self.num_workers,
+                progress_bar=self.progress_bar)
+        else:
+            result = self.__detect_image_files()
+
         if len(result) != len(self.photogrammetry_software.images):
             raise ValueError("Thread return has not the same length as the input parameters!")
 
-        aruco_ids = []
-        self.all_aruco_ids = []  # Reset the list of all ArUco IDs
+        images = self.photogrammetry_software.images
+        detection_image_ids = []
+        detection_aruco_ids = []
+        detection_corners = []
 
-        for image_idx, image_key in enumerate(self.photogrammetry_software.images.keys()):
-            ratio_x = self.photogrammetry_software.cameras[1].width / result[image_idx][2][1]
-            ratio_y = self.photogrammetry_software.cameras[1].height / result[image_idx][2][0]
-            if result[image_idx][0] != None:
-                corners = (np.expand_dims(np.vstack([result[image_idx][0][0][0, :, 0] * ratio_y,
-                                                     result[image_idx][0][0][0, :, 1] * ratio_x]).T, axis=0),)
-                self.photogrammetry_software.images[image_key].aruco_corners = corners
-                
-                # Store the ArUco ID
-                current_id = result[image_idx][1][0][0]
-                aruco_ids.append(current_id)
-                
-                # Add to the list of all ArUco IDs if not already present
-                if current_id not in self.all_aruco_ids:
-                    self.all_aruco_ids.append(current_id)
-            else:
-                self.photogrammetry_software.images[image_key].aruco_corners = result[image_idx][0]
+        for image_idx, image_key in enumerate(images.keys()):
+            images[image_key].image_path = self.image_names[image_idx]
+            corners, aruco_ids = result[image_idx][:2]
+            if aruco_ids is None:
+                images[image_key].aruco_corners = None
+                images[image_key].aruco_id = None
+                continue
+
+            # Scale all markers of the image from image to COLMAP camera resolution
+            camera = self.photogrammetry_software.cameras[images[image_key].camera_id]
+            ratio_x = camera.width / result[image_idx][2][1]
+            ratio_y = camera.height / result[image_idx][2][0]
+            corners = np.asarray(corners, dtype=float).reshape(-1, 4, 2) * np.array([ratio_x, ratio_y])
+
+            images[image_key].aruco_corners = tuple(corners[:, np.newaxis])
+            images[image_key].aruco_id = aruco_ids
 
-            self.photogrammetry_software.images[image_key].aruco_id = result[image_idx][1]
-            self.photogrammetry_software.images[image_key].image_path = self.image_names[image_idx]
+            detection_image_ids.extend([image_key] * len(corners))
+            detection_aruco_ids.extend(np.ravel(aruco_ids).tolist())
+            detection_corners.append(corners)
+
+        self.detection_image_ids = np.array(detection_image_ids, dtype=int)
+        self.detection_aruco_ids = np.array(detection_aruco_ids, dtype=int)
+        self.detection_corners = np.concatenate(detection_corners) if detection_corners else np.empty((0, 4, 2))
+
+        # All IDs in order of their first detection
+        self.all_aruco_ids = list(dict.fromkeys(detection_aruco_ids))
 
         # Determine the dominant ArUco ID (most frequent)
-        if aruco_ids:
-            self.dominant_aruco_id = np.argmax(np.bincount(aruco_ids))
+        if detection_aruco_ids:
+            self.dominant_aruco_id = np.argmax(np.bincount(detection_aruco_ids))
             
             # If target_id is not specified (or is -1), use the dominant ID
             if self.target_id == -1:
@@ -198,6 +294,46 @@ class ArucoLocalizer(LocalizerBase):
         else:
             logging.warning("No ArUco markers detected in any images")
 
+    def __detect_image_files(self) -> list:
+        """
+        Detects the markers in the image files of the project. Images which did not change since the last run are
+        taken from the detection cache.
+
+        :return: Results of detect_aruco_marker in the order of image_names
+        """
+        detector_key = DetectionCache.detector_key(self.aruco_dict_type, self.decode_reduction)
+        if self.detection_cache_path is not None:
+            with DetectionCache(self.detection_cache_path) as cache:
+                result = cache.get(self.image_names, detector_key)
+        else:
+            result = [None] * len(self.image_names)
+
+        # Only detect in images which are new or changed since the last run
+        pending = [image_idx for image_idx, cached in enumerate(result) if cached is None]
+        logging.info(f"Detecting markers in {len(pending)} of {len(self.image_names)} images "
+                     f"({len(self.image_names) - len(pending)} cached)")
+        if pending:
+            pending_names = [self.image_names[image_idx] for image_idx in pending]
+
+            detections = detect_aruco_markers(pending_names,
+                                              dict_type=self.aruco_dict_type,
+                                              reduction=self.decode_reduction,
+                                              backend=self.detection_backend,
+                                              num_workers=self.num_workers,
+                                              chunksize=self.chunksize,
+                                              progress_bar=self.progress_bar,
+                                              num_readers=self.num_readers,
+                                              prefetch=self.prefetch)
+
+            for image_idx, detection in zip(pending, detections):
+                result[image_idx] = detection
+
+            if self.detection_cache_path is not None:
+                with DetectionCache(self.detection_cache_path) as cache:
+                    cache.put(pending_names, detections, detector_key)
+
+        return result
+
     def __ray_cast(self):
         """
         This function casts a ray from the origin of the camera center C_i (also the translational part of the extrinsic
@@ -208,34 +344,53 @@ class ArucoLocalizer(LocalizerBase):
 
         :return:
         """
-        # Reset P0 and N for the target ID
-        self.P0 = np.array([])
-        self.N = np.array([])
-        
-        # Dictionary to store P0 and N for each ArUco ID
-        self.all_P0 = {id: np.array([]) for id in self.all_aruco_ids}
-        self.all_N = {id: np.array([]) for id in self.all_aruco_ids}
-        
-        for image_idx in self.photogrammetry_software.images.keys():
-            if self.photogrammetry_software.images[image_idx].aruco_corners is not None:
-                current_id = self.photogrammetry_software.images[image_idx].aruco_id[0, 0]
-                
-                # Process all detected ArUco markers
-                p0, n = ray_cast_aruco_corners(extrinsics=self.photogrammetry_software.images[image_idx].extrinsics,
-                                               intrinsics=self.photogrammetry_software.images[image_idx].intrinsics.K,
-                                               corners=self.photogrammetry_software.images[image_idx].aruco_corners)
-                
-                self.photogrammetry_software.images[image_idx].p0 = p0
-                self.photogrammetry_software.images[image_idx].n = n
-                
-                # Store data for all ArUco IDs
-                self.all_P0[current_id] = np.append(self.all_P0[current_id], p0)
-                self.all_N[current_id] = np.append(self.all_N[current_id], n)
-                
-                # If this is the target ID, also store in the main P0 and N arrays
-                if current_id == self.target_id:
-                    self.P0 = np.append(self.P0, p0)
-                    self.N = np.append(self.N, n)
+        images = self.photogrammetry_software.images
+        # Pose and intrinsics of every image with detections, indexed per detection
+        detected, rows = np.unique(self.detection_image_ids, return_inverse=True)
+        extrinsics = np.array([images[image_idx].extrinsics for image_idx in detected]).reshape(-1, 4, 4)
+        intrinsics = np.array([images[image_idx].intrinsics.K for image_idx in detected]).reshape(-1, 3, 3)
+
+        # Cast the rays of all markers of all images at once
+        if len(self.detection_corners) > 0:
+            p0, n = ray_cast_aruco_corners_batched(extrinsics=extrinsics[rows],
+                                                   intrinsics=intrinsics[rows],
+                                                   corners=self.detection_corners)
+        else:
+            p0, n = np.empty((0, 3)), np.empty((0, 4, 3))
+
+        # Rays of the target ID per image (used for visualization)
+        for image_idx in images.keys():
+            images[image_idx].p0 = None
+            images[image_idx].n = None
+        for k in np.flatnonzero(self.detection_aruco_ids == self.target_id):
+            images[self.detection_image_ids[k]].p0 = p0[k]
+            images[self.detection_image_ids[k]].n = n[k]
+
+        # Ray origins (K, 3) and directions (K, 4, 3) for each ArUco ID, one entry per detection
+        self.all_P0 = {aruco_id: p0[self.detection_aruco_ids == aruco_id] for aruco_id in self.all_aruco_ids}
+        self.all_N = {aruco_id: n[self.detection_aruco_ids == aruco_id] for aruco_id in self.all_aruco_ids}
+
+        # Rays of the target ID
+        self.P0 = self.all_P0.get(self.target_id, np.empty((0, 3)))
+        self.N = self.all_N.get(self.target_id, np.empty((0, 4, 3)))
+
+    def __intersect(self, aruco_id: int) -> np.ndarray:
+        """
+        Intersects the rays of all views of one ArUco ID, either with least squares or robustly (see run).
+
+        :param aruco_id: ArUco ID
+        :return: 3D corners (4, 3)
+        """
+        if not self.robust:
+            return intersect_parallelized(P0=self.all_P0[aruco_id], N=self.all_N[aruco_id])
+
+        corners_3d, residuals, inliers = intersect_robust(P0=self.all_P0[aruco_id], N=self.all_N[aruco_id],
+                                                          threshold=self.inlier_threshold)
+        self.view_residuals[aruco_id] = residuals
+        self.view_inliers[aruco_id] = inliers
+        if not np.all(inliers):
+            logging.info(f"ArUco ID {aruco_id}: {np.sum(~inliers)} of {len(inliers)} views rejected as outliers")
+        return corners_3d
 
     @staticmethod
     def __evaluate(aruco_corners_3d: np.ndarray) -> np.ndarray:
@@ -261,12 +416,18 @@ class ArucoLocalizer(LocalizerBase):
         @return:
         """
 
-        sf = np.zeros(len(self.P0) // 3)
+        if len(self.P0) < 2:
+            logging.warning('Scale factor analysis needs rays of the target marker from at least two images')
+            return
+
+        sf = np.zeros(len(self.P0))
 
-        for i in range(2, len(self.P0) // 3 + 1):
-            P0_i = self.P0.reshape(len(self.P0) // 3, 3)[:i]
-            N_i = self.N.reshape(len(self.N) // 12, 4, 3)[:i]
-            aruco_corners_3d = intersect_parallelized(P0=P0_i, N=N_i)
+        # Add one image after another and re-estimate, O(1) per image
+        intersector = IncrementalIntersector()
+        intersector.add(self.P0[0], self.N[0])
+        for i in range(2, len(self.P0) + 1):
+            intersector.add(self.P0[i - 1], self.N[i - 1])
+            aruco_corners_3d = intersector.estimate()
             aruco_dist = self.__evaluate(aruco_corners_3d)
             sf[i - 1] = (self.aruco_size) / aruco_dist
 
@@ -275,7 +436,7 @@ class ArucoLocalizer(LocalizerBase):
         plt.xlabel('# Images')
         plt.ylabel('Scale Factor')
         plt.grid()
-        plt.plot(np.linspace(1, len(self.P0) // 3, len(self.P0) // 3)[1:], sf[1:])
+        plt.plot(np.linspace(1, len(self.P0), len(self.P0))[1:], sf[1:])
         plt.show()
 
     def get_dense_scaled(self):
@@ -284,29 +445,33 @@ class ArucoLocalizer(LocalizerBase):
     def get_sparse_scaled(self):
         return generate_colmap_sparse_pc(self.sparse_scaled)
 
-    def apply(self) -> Tuple[o3d.pybind.geometry.PointCloud, float]:
+    def apply(self, in_place: bool = False,
+              scale_dense: bool = True) -> Tuple[Union[o3d.pybind.geometry.PointCloud, None], float]:
         """
         This function can be used if the scaling of the dense point cloud should be applied directly + the extrinsic
-        paramters should be scaled.
-
-        ToDo: save them to a folder!
-        @param true_scale:
-        @return:
+        paramters should be scaled. Sparse points and poses are scaled with one array operation, the scaled records
+        share everything but xyz and tvec with the originals (no deepcopy of tracks or loaded image data).
+
+        @param in_place: Scale the dense point cloud, sparse points and poses of the project itself instead of copies.
+            Avoids the copy of the dense point cloud, which doubles the peak memory on large models
+        @param scale_dense: Scale the loaded dense point cloud. If False the dense point cloud is not touched and
+            write_data streams the scaled cloud from the fused PLY file instead
+        @return: Scaled dense point cloud (None without scale_dense) and scale factor
         """
 
         self.scale_factor = (self.aruco_size) / self.aruco_distance
-        self.photogrammetry_software.dense_scaled = deepcopy(self.photogrammetry_software.dense)
-        self.photogrammetry_software.dense_scaled.scale(scale=self.scale_factor, center=np.asarray([0., 0., 0.]))
 
-        self.sparse_scaled = deepcopy(self.photogrammetry_software.sparse)
-        for num in self.photogrammetry_software.sparse.keys():
-            self.sparse_scaled[num].xyz = self.sparse_scaled[num].xyz * self.scale_factor
+        if scale_dense:
+            dense = self.photogrammetry_software.dense
+            self.photogrammetry_software.dense_scaled = dense if in_place else o3d.geometry.PointCloud(dense)
+            self.photogrammetry_software.dense_scaled.scale(scale=self.scale_factor, center=np.asarray([0., 0., 0.]))
+        else:
+            self.photogrammetry_software.dense_scaled = None
 
-        # ToDo: Scale tvec and save
-        self.photogrammetry_software.images_scaled = deepcopy(self.photogrammetry_software.images)
-        for idx in self.photogrammetry_software.images_scaled.keys():
-            self.photogrammetry_software.images_scaled[idx].tvec = self.photogrammetry_software.images[
-                                                                       idx].tvec * self.scale_factor
+        self.sparse_scaled = scale_records(self.photogrammetry_software.sparse, 'xyz', self.scale_factor,
+                                           in_place=in_place)
+        self.photogrammetry_software.images_scaled = scale_records(self.photogrammetry_software.images, 'tvec',
+                                                                   self.scale_factor, in_place=in_place)
 
         return self.photogrammetry_software.dense_scaled, self.scale_factor
 
@@ -319,13 +484,9 @@ class ArucoLocalizer(LocalizerBase):
         # Calculate 3D corners for all ArUco IDs
         for aruco_id in self.all_aruco_ids:
             if len(self.all_P0[aruco_id]) > 0:  # Only process if we have data for this ID
-                P0_reshaped = self.all_P0[aruco_id].reshape(len(self.all_P0[aruco_id]) // 3, 3)
-                N_reshaped = self.all_N[aruco_id].reshape(len(self.all_N[aruco_id]) // 12, 4, 3)
-                
-                if len(P0_reshaped) > 0 and len(N_reshaped) > 0:
-                    corners_3d = intersect_parallelized(P0=P0_reshaped, N=N_reshaped)
-                    self.all_aruco_corners_3d[aruco_id] = corners_3d
-                    logging.info(f"Calculated 3D corners for ArUco ID {aruco_id}")
+                corners_3d = self.__intersect(aruco_id)
+                self.all_aruco_corners_3d[aruco_id] = corners_3d
+                logging.info(f"Calculated 3D corners for ArUco ID {aruco_id}")
         
         return self.all_aruco_corners_3d
     
@@ -340,23 +501,29 @@ class ArucoLocalizer(LocalizerBase):
             self.calculate_all_aruco_positions()
         return self.all_aruco_corners_3d
 
-    def write_data(self):
+    def write_data(self, ext: str = '.bin'):
         """
         Write scaled data to files.
+
+        :param ext: Format of the scaled sparse model, '.bin' (default) or '.txt'
         """
         pcd_scaled = self.photogrammetry_software._project_path
         sparse_scaled_path = self.photogrammetry_software._project_path.joinpath('sparse_scaled')
-        cameras_scaled = sparse_scaled_path.joinpath('cameras.txt')
-        images_scaled = sparse_scaled_path.joinpath('images.txt')
-        points_scaled = sparse_scaled_path.joinpath('points3D.txt')
 
         sparse_scaled_path.mkdir(parents=True, exist_ok=True)
 
-        write_cameras_text(self.photogrammetry_software.cameras, cameras_scaled)
-        write_images_text(self.photogrammetry_software.images_scaled, images_scaled)
-        write_points3D_text(self.sparse_scaled, points_scaled)
+        write_model(cameras=colmap_cameras(self.photogrammetry_software.cameras),
+                    images=self.photogrammetry_software.images_scaled,
+                    points3D=self.sparse_scaled,
+                    path=str(sparse_scaled_path),
+                    ext=ext)
 
-        o3d.io.write_point_cloud(os.path.join(pcd_scaled, 'scaled.ply'), self.photogrammetry_software.dense_scaled)
+        if self.photogrammetry_software.dense_scaled is not None:
+            o3d.io.write_point_cloud(os.path.join(pcd_scaled, 'scaled.ply'), self.photogrammetry_software.dense_scaled)
+        else:
+            # Dense point cloud was not scaled in memory (see apply), stream it from the fused PLY
+            transform_ply(str(self.photogrammetry_software._fused_path), os.path.join(pcd_scaled, 'scaled.ply'),
+                          np.diag([self.scale_factor, self.scale_factor, self.scale_factor, 1.]))
 
         # Save scale factor
         scale_factor_file_name = self.photogrammetry_software._project_path.joinpath('sparse_scaled/scale_factor.txt')
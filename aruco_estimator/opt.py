@@ -54,31 +54,214 @@ def ls_intersection_of_lines(P0: np.ndarray, N: np.ndarray) -> np.ndarray:
     return intersctions_3d
 
 
-def intersect_parallelized(P0: np.ndarray, N: np.ndarray) -> np.ndarray:
+def _accumulate_intersection(P0: np.ndarray, N: np.ndarray, weights: np.ndarray = None) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Accumulates sum_k (n_k n_k^T) and q = sum_k (I - n_k n_k^T) p_k over all K lines for every corner.
+
+    :param P0: Ray origins (K, Dim)
+    :param N: Normalized ray directions (K, #Corners, Dim)
+    :param weights: Optional weights (K, #Corners) of every ray. R then becomes sum(w) * I - sum(w n n^T)
+    :return: sum(n n^T) (#Corners, Dim, Dim) and q (#Corners, Dim)
+    """
+    if weights is None:
+        nn = np.einsum('kci,kcj->cij', N, N)
+        q = P0.sum(axis=0) - np.einsum('kci,kc->ci', N, np.einsum('kci,ki->kc', N, P0))
+    else:
+        nn = np.einsum('kc,kci,kcj->cij', weights, N, N)
+        q = weights.T @ P0 - np.einsum('kc,kci,kc->ci', weights, N, np.einsum('kci,ki->kc', N, P0))
+    return nn, q
+
+
+def _solve_intersection(R: np.ndarray, q: np.ndarray, max_condition: float) -> np.ndarray:
+    """
+    Solves the 3x3 systems R p = q of all corners in one batched call.
+
+    :param R: (#Corners, Dim, Dim)
+    :param q: (#Corners, Dim)
+    :param max_condition: Systems with a larger condition number (e.g. nearly parallel rays) are solved with the
+        pseudo inverse instead
+    :return: p (#Corners, Dim)
+    """
+    # R is symmetric positive semi-definite, its condition follows from the eigenvalues
+    eigvals = np.linalg.eigvalsh(R)
+    well_conditioned = eigvals[:, 0] > eigvals[:, -1] / max_condition
+
+    p = np.empty_like(q)
+    if np.any(well_conditioned):
+        p[well_conditioned] = np.linalg.solve(R[well_conditioned], q[well_conditioned][..., np.newaxis])[..., 0]
+    if not np.all(well_conditioned):
+        logging.warning('Ill-conditioned ray intersection for corners %s, falling back to pseudo inverse',
+                        np.flatnonzero(~well_conditioned).tolist())
+        p[~well_conditioned] = (np.linalg.pinv(R[~well_conditioned]) @ q[~well_conditioned][..., np.newaxis])[..., 0]
+
+    return p
+
+
+def intersect_parallelized(P0: np.ndarray, N: np.ndarray, max_condition: float = 1e10) -> np.ndarray:
     """
     Here the intersection of the rays are calculated. More info can be found in the method directly.
     The original resource for the underlying LS can be found here:
     https://silo.tips/download/least-squares-intersection-of-lines (Sorry this website is quite shady)
 
-    :param P0:
-    :param n:
-    :return:
+    R = sum_k (I - n_k n_k^T) and q = sum_k (I - n_k n_k^T) p_k are accumulated directly as 3x3 matrices and 3-vectors
+    per corner, so no (#Corners, #Lines, Dim, Dim) projector tensor is built. The 3x3 systems R p = q are solved in one
+    batched call.
+
+    :param P0: Ray origins (K, Dim)
+    :param N: Normalized ray directions (K, #Corners, Dim)
+    :param max_condition: Systems with a larger condition number (e.g. nearly parallel rays) are solved with the
+        pseudo inverse instead
+    :return: Intersection points (#Corners, Dim)
     """
-    # generate the array of all projectors. Shape (#Corners, #Lines, Dim, Dim)
-    I = np.zeros((N.shape[1], N.shape[0], N.shape[2], N.shape[2])) + np.eye(N.shape[2])
-    # I - n*n.T
-    projs = I - N.transpose(1, 0, 2)[..., np.newaxis] * N.transpose(1, 0, 2)[:, :, np.newaxis]
+    nn, q = _accumulate_intersection(P0, N)
 
-    # Sum over all K lines to get R
-    R = projs.sum(axis=1)
+    # Sum over all K lines: R = K * I - sum(n n^T)
+    R = len(P0) * np.eye(P0.shape[1]) - nn
 
-    # Sum over all K lines to get q
-    q = (projs @ P0[:, :, np.newaxis]).sum(axis=1)
+    return _solve_intersection(R, q, max_condition)
 
-    # P_hat = R_pseudo @ q
-    p = np.linalg.pinv(R) @ q
 
-    return p[..., 0]
+class IncrementalIntersector(object):
+    def __init__(self, num_corners: int = 4, dim: int = 3, max_condition: float = 1e10):
+        """
+        Online version of intersect_parallelized. The sums R and q of the least squares intersection are kept per
+        corner, so rays can be added (or removed again) as they arrive and the current intersection is available at
+        any time by solving #Corners small systems, independent of the number of rays seen so far.
+
+        :param num_corners: Number of corners (rays per view)
+        :param dim: Dimension of the points
+        :param max_condition: See intersect_parallelized
+        """
+        self.num_corners = num_corners
+        self.dim = dim
+        self.max_condition = max_condition
+
+        self.num_lines = 0
+        self.nn = np.zeros((num_corners, dim, dim))  # sum(n n^T)
+        self.q = np.zeros((num_corners, dim))
+
+    def add(self, p0: np.ndarray, n: np.ndarray):
+        """
+        Adds the rays of one view (p0 (Dim,), n (#Corners, Dim)) or of several views at once (P0 (K, Dim),
+        N (K, #Corners, Dim)).
+        """
+        P0 = np.asarray(p0, dtype=float).reshape(-1, self.dim)
+        N = np.asarray(n, dtype=float).reshape(-1, self.num_corners, self.dim)
+        nn, q = _accumulate_intersection(P0, N)
+        self.nn += nn
+        self.q += q
+        self.num_lines += len(P0)
+
+    def remove(self, p0: np.ndarray, n: np.ndarray):
+        """
+        Removes rays that were added before. Takes the same arguments as add.
+        """
+        P0 = np.asarray(p0, dtype=float).reshape(-1, self.dim)
+        N = np.asarray(n, dtype=float).reshape(-1, self.num_corners, self.dim)
+        if len(P0) > self.num_lines:
+            raise ValueError(f'Cannot remove {len(P0)} rays, only {self.num_lines} were added')
+        nn, q = _accumulate_intersection(P0, N)
+        self.nn -= nn
+        self.q -= q
+        self.num_lines -= len(P0)
+
+    def estimate(self) -> np.ndarray:
+        """
+        :return: Current intersection points (#Corners, Dim)
+        """
+        if self.num_lines == 0:
+            raise ValueError('No rays added')
+        R = self.num_lines * np.eye(self.dim) - self.nn
+        return _solve_intersection(R, self.q, self.max_condition)
+
+
+def ray_residuals(P0: np.ndarray, N: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Angular residuals between the rays and the intersection points. Angles are independent of the (unknown) scale of
+    the reconstruction, in contrast to point-to-ray distances.
+
+    :param P0: Ray origins (K, Dim)
+    :param N: Normalized ray directions (K, #Corners, Dim)
+    :param points: Intersection points (#Corners, Dim) or (H, #Corners, Dim) for H hypotheses
+    :return: Angles in radians (K, #Corners) or (H, K, #Corners)
+    """
+    d = points[..., np.newaxis, :, :] - P0[:, np.newaxis, :]
+    along = np.einsum('kci,...kci->...kc', N, d)
+    across = np.linalg.norm(d - along[..., np.newaxis] * N, axis=-1)
+    return np.arctan2(across, along)
+
+
+def intersect_robust(P0: np.ndarray, N: np.ndarray, threshold: float = 0.01, huber_delta: float = 0.005,
+                     num_hypotheses: int = 256, num_iterations: int = 10, seed: int = None) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Robust version of intersect_parallelized for captures with misdetected or mis-registered views.
+
+        1. RANSAC over views: every hypothesis is the intersection of the rays of two views. All hypotheses are
+           solved and scored against all views in batched calls.
+        2. Least squares intersection of the inlier views of the best hypothesis.
+        3. IRLS with Huber weights on the angular residuals of the inlier views.
+
+    :param P0: Ray origins (K, Dim)
+    :param N: Normalized ray directions (K, #Corners, Dim)
+    :param threshold: Inlier threshold for the mean angular residual of a view in radians
+    :param huber_delta: Angular residual in radians above which rays are down-weighted during IRLS
+    :param num_hypotheses: Maximal number of view pairs tried. All pairs are used if there are fewer
+    :param num_iterations: Number of IRLS iterations
+    :param seed: Seed for sampling the view pairs
+    :return: Intersection points (#Corners, Dim), mean angular residual per view (K,) and inlier mask (K,)
+    """
+    num_views, num_corners, dim = N.shape
+    if num_views < 3:
+        points = intersect_parallelized(P0, N)
+        residuals = ray_residuals(P0, N, points).mean(axis=1)
+        return points, residuals, np.ones(num_views, dtype=bool)
+
+    # Sample pairs of distinct views
+    if num_views * (num_views - 1) // 2 <= num_hypotheses:
+        pairs = np.stack(np.triu_indices(num_views, k=1), axis=1)
+    else:
+        rng = np.random.default_rng(seed)
+        first = rng.integers(0, num_views, num_hypotheses)
+        second = (first + rng.integers(1, num_views, num_hypotheses)) % num_views
+        pairs = np.stack([first, second], axis=1)
+
+    # Two view intersection of every hypothesis (H, #Corners, Dim)
+    N_pairs = N[pairs]
+    P0_pairs = P0[pairs]
+    nn = np.einsum('hkci,hkcj->hcij', N_pairs, N_pairs)
+    R = 2 * np.eye(dim) - nn
+    q = P0_pairs.sum(axis=1)[:, np.newaxis] - np.einsum('hkci,hkc->hci', N_pairs,
+                                                         np.einsum('hkci,hki->hkc', N_pairs, P0_pairs))
+    hypotheses = (np.linalg.pinv(R) @ q[..., np.newaxis])[..., 0]
+
+    # Score hypotheses in chunks to bound the (H, K, #Corners) residual tensor
+    num_inliers = np.empty(len(hypotheses), dtype=np.int64)
+    chunk = max(1, (1 << 22) // (num_views * num_corners))
+    for start in range(0, len(hypotheses), chunk):
+        residuals = ray_residuals(P0, N, hypotheses[start:start + chunk]).mean(axis=-1)
+        num_inliers[start:start + chunk] = (residuals < threshold).sum(axis=-1)
+
+    residuals = ray_residuals(P0, N, hypotheses[np.argmax(num_inliers)]).mean(axis=1)
+    inliers = residuals < threshold
+    if inliers.sum() < 2:
+        logging.warning('RANSAC found less than two consistent views, using all %d views', num_views)
+        inliers[:] = True
+
+    # Refine on the inliers
+    points = intersect_parallelized(P0[inliers], N[inliers])
+    for _ in range(num_iterations):
+        ray_error = ray_residuals(P0[inliers], N[inliers], points)
+        weights = np.minimum(1., huber_delta / np.maximum(ray_error, 1e-12))
+        nn, q = _accumulate_intersection(P0[inliers], N[inliers], weights)
+        R = weights.sum(axis=0)[:, np.newaxis, np.newaxis] * np.eye(dim) - nn
+        points = _solve_intersection(R, q, max_condition=1e10)
+
+    residuals = ray_residuals(P0, N, points).mean(axis=1)
+    logging.info('Robust intersection: %d of %d views are inliers', inliers.sum(), num_views)
+
+    return points, residuals, inliers
 
 
 def ls_intersection_of_lines_parallelized(P0: np.ndarray, N: np.ndarray) -> np.ndarray:
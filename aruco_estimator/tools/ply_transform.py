@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+import logging
+import shutil
+from typing import List, Tuple
+
+import numpy as np
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+PLY_FORMATS = {"binary_little_endian": "<", "binary_big_endian": ">"}
+
+
+def read_ply_header(path: str) -> Tuple[bytes, str, List[tuple]]:
+    """
+    Parses the header of a binary PLY file.
+
+    :param path: Path to the PLY file
+    :return: Raw header bytes (including end_header), byte order ('<' or '>') and the elements as list of
+        (name, count, properties). properties is a list of (name, type) or None if the element has list properties
+    """
+    byte_order = None
+    elements = []
+    with open(path, "rb") as fid:
+        header = fid.readline()
+        if header.strip() != b"ply":
+            raise ValueError(f"Not a PLY file: {path}")
+        while True:
+            line = fid.readline()
+            if not line:
+                raise ValueError(f"PLY header without end_header: {path}")
+            header += line
+            tokens = line.decode("ascii").split()
+            if not tokens:
+                continue
+            if tokens[0] == "end_header":
+                break
+            if tokens[0] == "format":
+                if tokens[1] not in PLY_FORMATS:
+                    raise ValueError(f"Only binary PLY files are supported, got format '{tokens[1]}'")
+                byte_order = PLY_FORMATS[tokens[1]]
+            elif tokens[0] == "element":
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == "property":
+                if tokens[1] == "list":
+                    elements[-1] = (elements[-1][0], elements[-1][1], None)
+                elif elements[-1][2] is not None:
+                    elements[-1][2].append((tokens[2], PLY_TYPES[tokens[1]]))
+
+    if byte_order is None:
+        raise ValueError(f"PLY header without format: {path}")
+    return header, byte_order, elements
+
+
+def _vertex_layout(path: str) -> Tuple[bytes, np.dtype, int, int]:
+    """
+    Header, vertex dtype, byte offset and number of vertices of a binary PLY file. Only fixed size elements may
+    precede the vertices.
+    """
+    header, byte_order, elements = read_ply_header(path)
+
+    offset = len(header)
+    for name, count, properties in elements:
+        if properties is None:
+            raise ValueError(f"Element '{name}' with list properties before or as vertex element is not supported")
+        dtype = np.dtype([(prop, byte_order + prop_type) for prop, prop_type in properties])
+        if name == "vertex":
+            break
+        offset += count * dtype.itemsize
+    else:
+        raise ValueError(f"PLY file without vertex element: {path}")
+
+    if not all(axis in dtype.names for axis in ("x", "y", "z")):
+        raise ValueError("PLY vertices without x, y, z")
+    return header, dtype, offset, count
+
+
+def read_ply_points(path: str, step: int = 1) -> np.ndarray:
+    """
+    Reads the vertex positions of a binary PLY file without loading the other properties.
+
+    :param path: Binary PLY file
+    :param step: Read only every step-th vertex
+    :return: Positions (N, 3)
+    """
+    _, dtype, offset, count = _vertex_layout(path)
+    if count == 0:
+        return np.empty((0, 3))
+    vertices = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))[::step]
+    points = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1).astype(np.float64)
+    del vertices
+    return points
+
+
+def transform_ply(input_path: str, output_path: str, transform: np.ndarray, chunk_size: int = 1 << 20) -> int:
+    """
+    Applies a 4x4 similarity (or affine) transform to the vertices of a binary PLY file and writes the result to a
+    new file. The vertices are memory mapped and transformed chunk by chunk, so memory use is independent of the
+    size of the point cloud. Positions (x, y, z) are transformed with the full transform, normals (nx, ny, nz) with
+    the inverse transpose of its linear part and renormalized. All other properties and elements are copied as is.
+
+    :param input_path: Binary PLY file
+    :param output_path: Transformed PLY file, same layout as the input
+    :param transform: Transform (4, 4) with last row [0, 0, 0, 1]
+    :param chunk_size: Number of vertices per chunk
+    :return: Number of transformed vertices
+    """
+    transform = np.asarray(transform, dtype=np.float64)
+    if transform.shape != (4, 4) or not np.allclose(transform[3], [0, 0, 0, 1]):
+        raise ValueError("Expected an affine 4x4 transform with last row [0, 0, 0, 1]")
+    A, t = transform[:3, :3], transform[:3, 3]
+    A_normals = np.linalg.inv(A).T
+
+    header, dtype, offset, count = _vertex_layout(input_path)
+
+    names = dtype.names
+    has_normals = all(axis in names for axis in ("nx", "ny", "nz"))
+
+    # memmap cannot map zero bytes
+    vertices = np.memmap(input_path, dtype=dtype, mode="r", offset=offset, shape=(count,)) if count else \
+        np.empty(0, dtype=dtype)
+    with open(output_path, "wb") as out:
+        out.write(header)
+        for start in range(0, count, chunk_size):
+            chunk = np.array(vertices[start:start + chunk_size])
+
+            xyz = np.stack([chunk["x"], chunk["y"], chunk["z"]], axis=1).astype(np.float64)
+            xyz = xyz @ A.T + t
+            chunk["x"], chunk["y"], chunk["z"] = xyz.T
+
+            if has_normals:
+                normals = np.stack([chunk["nx"], chunk["ny"], chunk["nz"]], axis=1).astype(np.float64) @ A_normals.T
+                norm = np.linalg.norm(normals, axis=1, keepdims=True)
+                normals = np.divide(normals, norm, out=np.zeros_like(normals), where=norm > 0)
+                chunk["nx"], chunk["ny"], chunk["nz"] = normals.T
+
+            out.write(chunk.tobytes())
+
+        # Remaining elements (e.g. faces) are copied unchanged
+        with open(input_path, "rb") as fid:
+            fid.seek(offset + count * dtype.itemsize)
+            shutil.copyfileobj(fid, out)
+
+    del vertices
+    logging.info(f"Transformed {count} vertices of {input_path} into {output_path}")
+    return count
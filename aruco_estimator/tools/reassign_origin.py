@@ -4,24 +4,27 @@
 import logging
 import os
 from pathlib import Path
+from typing import Tuple
 
 import click
 import cv2
 import numpy as np
 import open3d
-from colmap_wrapper.colmap import COLMAP, generate_colmap_sparse_pc
+from colmap_wrapper.colmap import generate_colmap_sparse_pc
 from scipy.spatial.transform import Rotation
 
+from aruco_estimator.colmap.pose_source import PoseSource
 from aruco_estimator.colmap.read_write_model import (
     Image,
     Point3D,
-    qvec2rotmat,
-    read_model,
-    rotmat2qvec,
-    write_model,
+    qvecs2rotmats,
+    rotmats2qvecs,
 )
+from aruco_estimator.colmap.reconstruction import Reconstruction
 from aruco_estimator.colmap.visualize_model import Model
+from aruco_estimator.frame_source import VideoFrameSource
 from aruco_estimator.localizers import ArucoLocalizer
+from aruco_estimator.tools.ply_transform import transform_ply
 
 
 def get_normalization_transform(aruco_corners_3d: np.ndarray, aruco_size: float) -> np.ndarray:
@@ -91,44 +94,66 @@ def get_normalization_transform(aruco_corners_3d: np.ndarray, aruco_size: float)
     return transform
 
 
-def normalize_poses_and_points(cameras, images, points3D, transform: np.ndarray):
-    """Apply normalization transform to camera poses and 3D points."""
-    
+def _split_normalization_transform(transform: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Splits the scaled normalization transform into a rigid 4x4 transform and its scale factor."""
     # Extract the scale factor from the transformation matrix
     scale_factor = np.linalg.norm(transform[:3, 0])
     logging.info(f"Extracted scale factor from transform: {scale_factor:.4f}")
-    
+
     # Prepare a rotation-only transform (scale removed)
     normalized_transform = np.eye(4)
     normalized_transform[:3, :3] = transform[:3, :3] / scale_factor
     normalized_transform[:3, 3] = transform[:3, 3] / scale_factor
 
+    return normalized_transform, scale_factor
+
+
+def transform_poses(qvecs: np.ndarray, tvecs: np.ndarray, normalized_transform: np.ndarray,
+                    scale_factor: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Applies the normalization to all world-to-camera poses at once.
+
+    :param qvecs: Quaternions (M, 4)
+    :param tvecs: Translations (M, 3)
+    :param normalized_transform: Rigid 4x4 transform (scale removed)
+    :param scale_factor: Scale which is reapplied to the translations
+    :return: Transformed quaternions (M, 4) and translations (M, 3)
+    """
     # Compute the inverse transform for camera poses
     inverse_normalized_transform = np.linalg.inv(normalized_transform)
 
+    # Apply inverse of normalization transform to [R|t] of every pose
+    R = qvecs2rotmats(qvecs)
+    new_R = R @ inverse_normalized_transform[:3, :3]
+    new_t = (R @ inverse_normalized_transform[:3, 3] + tvecs) * scale_factor  # Reapply scale only to translation
+
+    return rotmats2qvecs(new_R), new_t
+
+
+def transform_points(xyz: np.ndarray, transform: np.ndarray) -> np.ndarray:
+    """
+    Applies a 4x4 transform to points of shape (N, 3).
+    """
+    return xyz @ transform[:3, :3].T + transform[:3, 3]
+
+
+def normalize_poses_and_points(cameras, images, points3D, transform: np.ndarray):
+    """Apply normalization transform to camera poses and 3D points."""
+    normalized_transform, scale_factor = _split_normalization_transform(transform)
+
     # Transform camera poses
+    image_list = list(images.values())
+    qvecs, tvecs = transform_poses(qvecs=np.array([image.qvec for image in image_list]).reshape(-1, 4),
+                                   tvecs=np.array([image.tvec for image in image_list]).reshape(-1, 3),
+                                   normalized_transform=normalized_transform,
+                                   scale_factor=scale_factor)
     transformed_images = {}
-    for image_id, image in images.items():
-        # Original pose
-        R = qvec2rotmat(image.qvec)
-        t = image.tvec
-        pose = np.eye(4)
-        pose[:3, :3] = R
-        pose[:3, 3] = t
-
-        # Apply inverse of normalization transform
-        rotated_pose = pose @ inverse_normalized_transform
-        rotated_pose[:3, 3] *= scale_factor  # Reapply scale only to translation
-
-        # Extract new rotation and translation
-        new_R = rotated_pose[:3, :3]
-        new_t = rotated_pose[:3, 3]
-
+    for image, qvec, tvec in zip(image_list, qvecs, tvecs):
         # Create new image with transformed pose
-        transformed_images[image_id] = Image(
+        transformed_images[image.id] = Image(
             id=image.id,
-            qvec=rotmat2qvec(new_R),
-            tvec=new_t,
+            qvec=qvec,
+            tvec=tvec,
             camera_id=image.camera_id,
             name=image.name,
             xys=image.xys,
@@ -136,12 +161,11 @@ def normalize_poses_and_points(cameras, images, points3D, transform: np.ndarray)
         )
 
     # Transform 3D points
+    point_list = list(points3D.values())
+    xyz = transform_points(np.array([point3D.xyz for point3D in point_list]).reshape(-1, 3), normalized_transform)
     transformed_points3D = {}
-    for point3D_id, point3D in points3D.items():
-        point_h = np.append(point3D.xyz, 1)
-        transformed_h = normalized_transform @ point_h
-        new_xyz = transformed_h[:3]
-        transformed_points3D[point3D_id] = Point3D(
+    for point3D, new_xyz in zip(point_list, xyz):
+        transformed_points3D[point3D.id] = Point3D(
             id=point3D.id,
             xyz=new_xyz,
             rgb=point3D.rgb,
@@ -152,20 +176,44 @@ def normalize_poses_and_points(cameras, images, points3D, transform: np.ndarray)
 
     return cameras, transformed_images, transformed_points3D
 
-def save_normalized_data(cameras, images, points3D, output_path: Path) -> None:
-    """Save normalized poses and points using COLMAP structure"""
+
+def normalize_reconstruction(reconstruction: Reconstruction, transform: np.ndarray) -> Reconstruction:
+    """
+    Columnar version of normalize_poses_and_points. Poses and points are transformed with single array operations,
+    all other arrays are shared with the input reconstruction.
+    """
+    normalized_transform, scale_factor = _split_normalization_transform(transform)
+
+    qvecs, tvecs = transform_poses(qvecs=reconstruction.qvec,
+                                   tvecs=reconstruction.tvec,
+                                   normalized_transform=normalized_transform,
+                                   scale_factor=scale_factor)
+    image_columns = reconstruction.image_columns()
+    image_columns.update(qvec=qvecs, tvec=tvecs)
+
+    point_columns = reconstruction.point_columns()
+    point_columns.update(xyz=transform_points(reconstruction.xyz, normalized_transform))
+
+    return Reconstruction(cameras=reconstruction.cameras, image_columns=image_columns, point_columns=point_columns)
+
+
+def save_normalized_data(reconstruction: Reconstruction, output_path: Path, ext: str = ".bin") -> None:
+    """Save normalized poses and points using COLMAP structure (binary by default)"""
     # Create normalized/sparse directory
     output_dir = output_path / "normalized" / "sparse"
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Write transformed data
-    write_model(cameras, images, points3D, str(output_dir))
+    reconstruction.write(str(output_dir), ext=ext)
 
 def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
                    dict_type: int = cv2.aruco.DICT_4X4_50,
                    show_original: bool = False, visualize: bool = False,
                    target_id: int = 0, export_tags: bool = False,
-                   export_path: str = None):
+                   export_path: str = None, robust: bool = False, cache: bool = True,
+                   backend: str = 'process', num_workers: int = None,
+                   video: str = None, video_stride: int = 1, video_first_index: int = 1,
+                   transform_dense: bool = False):
     """
     Normalize COLMAP poses relative to ArUco marker.
     
@@ -178,6 +226,15 @@ def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
         target_id: ID of ArUco marker to use as origin (default: 0)
         export_tags: Whether to export tag positions (default: False)
         export_path: Path to export tag positions (default: project_path/aruco_tags.json)
+        robust: Whether to reject misdetected views with RANSAC + IRLS (default: False)
+        cache: Whether to reuse detections of unchanged images from project_path/aruco_detections.db (default: True)
+        backend: Parallel detection backend, 'process', 'thread' or 'pipeline' (default: 'process')
+        num_workers: Number of detection workers (default: number of CPUs)
+        video: Read the frames from this video instead of the image files (default: None)
+        video_stride: Number of video frames between two extracted images (default: 1)
+        video_first_index: Number in the name of the first extracted image (default: 1)
+        transform_dense: Whether to also write the normalized dense point cloud to normalized/fused.ply. The binary
+            PLY is streamed in chunks and never loaded as a whole (default: False)
     """
     project_path = Path(colmap_project)
     logging.basicConfig(level=logging.INFO)
@@ -189,18 +246,25 @@ def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
     # Load COLMAP data
     logging.info("Loading COLMAP data...")
     sparse_dir = os.path.join(project_path, "sparse")
-    cameras, images, points3D = read_model(sparse_dir)
+    reconstruction = Reconstruction.read(sparse_dir)
     
-    # Use COLMAP project only for ArUco detection
+    # Detection only needs the poses of the already loaded model, not the dense data of a full COLMAP project
     logging.info("Detecting ArUco markers...")
-    project = COLMAP(project_path=str(project_path))
+    project = PoseSource(project_path, reconstruction=reconstruction)
     aruco_localizer = ArucoLocalizer(
         photogrammetry_software=project,
         aruco_size=aruco_size,
         dict_type=dict_type,
         target_id=target_id
     )
-    aruco_distance, aruco_corners_3d = aruco_localizer.run()
+    if not cache:
+        aruco_localizer.detection_cache_path = None
+    aruco_localizer.detection_backend = backend
+    if num_workers is not None:
+        aruco_localizer.num_workers = num_workers
+    if video is not None:
+        aruco_localizer.frame_source = VideoFrameSource(video, stride=video_stride, index_offset=video_first_index)
+    aruco_distance, aruco_corners_3d = aruco_localizer.run(robust=robust)
     logging.info(f"Target ArUco ID: {target_id}")
     logging.info(f"ArUco 3d points: {aruco_corners_3d}")
     logging.info(f"ArUco marker distance: {aruco_distance}")
@@ -216,7 +280,7 @@ def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
     
     # Apply normalization to loaded data
     logging.info("Normalizing poses and 3D points...")
-    cameras_norm, images_norm, points3D_norm = normalize_poses_and_points(cameras, images, points3D, transform)
+    reconstruction_norm = normalize_reconstruction(reconstruction, transform)
     
     # Verify the scaling worked correctly by measuring the marker in the transformed space
     transformed_corners = np.array([
@@ -231,6 +295,9 @@ def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
     logging.info(f"Target ArUco size: {aruco_size}")
     
     if visualize:
+        cameras, images, points3D = reconstruction.to_dicts()
+        cameras_norm, images_norm, points3D_norm = reconstruction_norm.to_dicts()
+
         # Create visualization model
         model = Model()
         model.create_window()
@@ -345,6 +412,13 @@ def reassign_origin(colmap_project: str, aruco_size: float = 0.2,
     
     # Save transformed data
     logging.info("Saving normalized data...")
-    save_normalized_data(cameras_norm, images_norm, points3D_norm, project_path)
+    save_normalized_data(reconstruction_norm, project_path)
+
+    if transform_dense:
+        if project._fused_path.exists():
+            logging.info("Normalizing dense point cloud...")
+            transform_ply(str(project._fused_path), str(project_path / "normalized" / "fused.ply"), transform)
+        else:
+            logging.warning(f"No dense point cloud found at {project._fused_path}")
     
     logging.info("Done! Normalized data saved to normalized/sparse/")
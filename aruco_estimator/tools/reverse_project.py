@@ -1,9 +1,15 @@
+import json
 import os
+import queue
+import threading
+from multiprocessing import Pool
 
 import cv2
 import numpy as np
 
-from aruco_estimator.colmap.read_write_model import read_model
+from aruco_estimator.colmap.projection import occluded_points, project_points_batched
+from aruco_estimator.colmap.read_write_model import qvecs2rotmats, read_model
+from aruco_estimator.tools.ply_transform import read_ply_points
 
 
 def read_key_positions(filepath):
@@ -46,42 +52,44 @@ def project_points(points, cam_params, rvec, tvec):
     Project 3D points to image coordinates.
     Returns projected points and a mask indicating which points are in front of the camera.
     """
-    # Camera matrix
-    if cam_params.model == "SIMPLE_PINHOLE":
-        fx = fy = cam_params.params[0]
-        cx, cy = cam_params.params[1:]
-        dist_coeffs = np.zeros(4)
-    elif cam_params.model == "PINHOLE":
-        fx, fy = cam_params.params[0:2]
-        cx, cy = cam_params.params[2:]
-        dist_coeffs = np.zeros(4)
-    elif cam_params.model == "SIMPLE_RADIAL":
-        fx = fy = cam_params.params[0]
-        cx, cy = cam_params.params[1:3]
-        k = cam_params.params[3]
-        dist_coeffs = np.array([k, 0, 0, 0])  # k1, k2, p1, p2
-    else:
-        raise ValueError(f"Unsupported camera model: {cam_params.model}")
-    
-    K = np.array([[fx, 0, cx],
-                  [0, fy, cy],
-                  [0, 0, 1]])
+    R, _ = cv2.Rodrigues(np.asarray(rvec, dtype=float))
+    img_points, in_front, _ = project_points_batched(points, R[np.newaxis], np.asarray(tvec).reshape(1, 3),
+                                                     {cam_params.id: cam_params}, [cam_params.id])
+    return img_points[0], in_front[0]
 
-    # Convert points to camera coordinate system
-    R, _ = cv2.Rodrigues(rvec)
-    points_cam = (R @ points.T).T + tvec.reshape(1, 3)
-    
-    # Check which points are in front of the camera (Z > 0)
-    in_front = points_cam[:, 2] > 0
-    
-    # Project points
-    img_points, _ = cv2.projectPoints(points, rvec, tvec, K, dist_coeffs)
-    img_points = img_points.reshape(-1, 2)
-    
-    # Set points behind camera to NaN
-    img_points[~in_front] = np.nan
-    
-    return img_points, in_front
+def write_label(label_path, bbox, keypoints, class_id=0):
+    """Write the YOLO label of one image from the output of label_arrays, nothing is written without points."""
+    if len(keypoints) == 0:
+        return
+    with open(label_path, 'w') as f:
+        f.write(format_label(bbox, keypoints, class_id))
+
+def _write_label_task(task):
+    write_label(*task)
+
+def write_label_shard(shard_path, names, bboxes, keypoints, class_id=0):
+    """
+    Write the labels of many images into a single file instead of one YOLO file per image.
+
+    Args:
+        shard_path: Output file, '.jsonl' (one JSON object per image) or '.npz' (stacked arrays)
+        names: Image names (S,)
+        bboxes: Normalized bounding boxes from label_arrays (S, 4)
+        keypoints: Normalized keypoints with visibility from label_arrays (S, K, 3)
+        class_id: Class of the labels
+    """
+    if shard_path.endswith('.npz'):
+        np.savez(shard_path, names=np.array(names), class_id=class_id,
+                 bboxes=bboxes.astype(np.float32), keypoints=keypoints.astype(np.float32))
+    elif shard_path.endswith('.jsonl'):
+        bboxes = np.round(bboxes, 6).tolist()
+        keypoints = np.round(keypoints, 6).tolist()
+        with open(shard_path, 'w') as f:
+            for name, bbox, image_keypoints in zip(names, bboxes, keypoints):
+                f.write(json.dumps({"image": name, "class_id": class_id, "bbox": bbox,
+                                    "keypoints": image_keypoints}) + "\n")
+    else:
+        raise ValueError(f"Unsupported label shard format: {shard_path}")
 
 def draw_axes(img, cam_params, rvec, tvec, length=1):
     """Draw 3D coordinate axes on image."""
@@ -90,7 +98,13 @@ def draw_axes(img, cam_params, rvec, tvec, length=1):
     
     # Project points using existing function
     img_points, in_front = project_points(axis_points, cam_params, rvec, tvec)
-    
+    return draw_projected_axes(img, img_points, in_front)
+
+def draw_projected_axes(img, img_points, in_front):
+    """Draw coordinate axes from the projected origin and axis end points (4, 2)."""
+    if not in_front[0] or np.isnan(img_points[0]).any():
+        return img
+
     # Draw axes only if points are in front of camera
     origin = tuple(map(int, img_points[0]))
     for i, (point, visible) in enumerate(zip(img_points[1:], in_front[1:]), 1):
@@ -101,6 +115,54 @@ def draw_axes(img, cam_params, rvec, tvec, length=1):
     
     return img
 
+def circle_stamp(radius, thickness=-1):
+    """Pixel offsets (D, 2) as (dy, dx) of a circle drawn by cv2.circle around the origin."""
+    size = radius + max(thickness, 0) + 1
+    canvas = np.zeros((2 * size + 1, 2 * size + 1), dtype=np.uint8)
+    cv2.circle(canvas, (size, size), radius, 1, thickness)
+    return np.argwhere(canvas) - size
+
+def rasterize_points(img, points, colors, stamp, mask=None):
+    """
+    Draw all points at once by writing the pixels of a stamp (see circle_stamp) around every point. The result equals
+    one cv2.circle call per point, up to single pixels where cv2 clips outlines at the image border. Points whose
+    (truncated) center is outside the image are skipped.
+
+    Args:
+        img: Image (H, W, 3), drawn in place
+        points: Pixel coordinates (N, 2), NaN points are skipped
+        colors: Color per point (N, 3) or one color (3,)
+        stamp: Pixel offsets of the shape drawn around every point
+        mask: Optional mask of points to draw (N,)
+    """
+    h, w = img.shape[:2]
+    valid = ~np.isnan(points).any(axis=1)
+    if mask is not None:
+        valid &= mask
+    centers = points[valid].astype(int)
+    colors = np.broadcast_to(np.asarray(colors, dtype=img.dtype), (len(points), 3))[valid]
+
+    inside = (centers[:, 0] >= 0) & (centers[:, 0] < w) & (centers[:, 1] >= 0) & (centers[:, 1] < h)
+    centers, colors = centers[inside], colors[inside]
+
+    ys = centers[:, 1, np.newaxis] + stamp[:, 0]
+    xs = centers[:, 0, np.newaxis] + stamp[:, 1]
+    in_img = (ys >= 0) & (ys < h) & (xs >= 0) & (xs < w)
+    img[ys[in_img], xs[in_img]] = np.broadcast_to(colors[:, np.newaxis, :], ys.shape + (3,))[in_img]
+    return img
+
+def _write_images(write_queue):
+    """Encode and save the images of the queue until None is received."""
+    while True:
+        item = write_queue.get()
+        if item is None:
+            break
+        output_path, img = item
+        if cv2.imwrite(output_path, img):
+            print(f"Saved visualization to: {output_path}")
+        else:
+            print(f"Could not save visualization: {output_path}")
+
 def normalize_coordinates(points, img_shape):
     """Normalize coordinates to [0,1] range."""
     h, w = img_shape[:2]
@@ -108,67 +170,77 @@ def normalize_coordinates(points, img_shape):
     points[:, 1] = points[:, 1] / h
     return points
 
-def create_label_content(projected_points, img_shape, in_front, class_id=0):
+def label_arrays(projected_points, img_sizes, in_front, occluded=None):
+    """
+    Compute the YOLO bounding boxes and keypoints of many images at once.
+
+    Keypoints in front of the camera and inside the image are visible (2), or labeled (1) if the optional
+    occluded mask marks them as hidden behind the scene geometry. Keypoints behind the camera are (0, 0, 0).
+
+    Args:
+        projected_points: Projected keypoints (M, K, 2), NaN behind the camera
+        img_sizes: Image height and width (M, 2)
+        in_front: Mask of keypoints in front of the camera (M, K)
+        occluded: Optional mask of occluded keypoints (M, K)
+
+    Returns:
+        Normalized bounding boxes as x_center, y_center, width, height (M, 4) and normalized keypoints as
+        x, y, visibility (M, K, 3)
+    """
+    projected_points = np.asarray(projected_points, dtype=float)
+    img_sizes = np.asarray(img_sizes, dtype=float).reshape(-1, 1, 2)
+    h, w = img_sizes[..., 0], img_sizes[..., 1]
+    x, y = projected_points[..., 0], projected_points[..., 1]
+
+    # Point is visible if it's both in front of camera and within image bounds
+    in_bounds = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    is_visible = in_front & in_bounds
+
+    # Bounding box of the points that are not NaN, center of image without any
+    valid_mask = ~np.isnan(projected_points).any(axis=-1)
+    norm_x, norm_y = x / w, y / h
+    any_valid = valid_mask.any(axis=-1)
+    x_min = np.min(norm_x, axis=-1, where=valid_mask, initial=np.inf)
+    x_max = np.max(norm_x, axis=-1, where=valid_mask, initial=-np.inf)
+    y_min = np.min(norm_y, axis=-1, where=valid_mask, initial=np.inf)
+    y_max = np.max(norm_y, axis=-1, where=valid_mask, initial=-np.inf)
+    bboxes = np.where(any_valid[:, np.newaxis],
+                      np.stack([(x_min + x_max) / 2, (y_min + y_max) / 2, x_max - x_min, y_max - y_min], axis=-1),
+                      [0.5, 0.5, 0.0, 0.0])
+
+    visibility = np.where(is_visible, 2, 0)
+    if occluded is not None:
+        visibility = np.where(is_visible & occluded, 1, visibility)
+    keypoints = np.stack([np.where(valid_mask, norm_x, 0.0), np.where(valid_mask, norm_y, 0.0),
+                          np.where(valid_mask, visibility, 0)], axis=-1)
+
+    return bboxes, keypoints
+
+def format_label(bbox, keypoints, class_id=0):
+    """Format one YOLO label line, all keypoints are formatted in a single call."""
+    fmt = "%d %.6f %.6f %.6f %.6f" + " %.6f %.6f %d" * len(keypoints)
+    return fmt % (class_id, *np.asarray(bbox).tolist(), *np.asarray(keypoints).ravel().tolist())
+
+def create_label_content(projected_points, img_shape, in_front, class_id=0, occluded=None):
     """Create label content in YOLO format with keypoints."""
     if len(projected_points) == 0:
         return None  # Return None if no points
-    
-    h, w = img_shape[:2]
-    
-    # Check which points are within image bounds
-    in_bounds = np.logical_and.reduce([
-        projected_points[:, 0] >= 0,
-        projected_points[:, 0] < w,
-        projected_points[:, 1] >= 0,
-        projected_points[:, 1] < h
-    ])
-    
-    # Point is visible if it's both in front of camera and within image bounds
-    is_visible = np.logical_and(in_front, in_bounds)
-    
-    # Get valid points for bounding box calculation (not NaN)
-    valid_mask = ~np.isnan(projected_points).any(axis=1)
-    valid_points = projected_points[valid_mask]
-    
-    if len(valid_points) == 0:
-        # If all points are NaN, use center of image for bounding box
-        x_center, y_center = 0.5, 0.5
-        width, height = 0.0, 0.0
-    else:
-        # Normalize valid points and calculate bounding box
-        norm_valid_points = normalize_coordinates(valid_points.copy(), img_shape)
-        x_min, y_min = np.min(norm_valid_points, axis=0)
-        x_max, y_max = np.max(norm_valid_points, axis=0)
-        
-        # Calculate center and dimensions
-        x_center = (x_min + x_max) / 2
-        y_center = (y_min + y_max) / 2
-        width = x_max - x_min
-        height = y_max - y_min
-    
-    # Format label line
-    label_parts = [str(class_id), f"{x_center:.6f}", f"{y_center:.6f}", 
-                   f"{width:.6f}", f"{height:.6f}"]
-    
-    # Add keypoints
-    for i, ((x, y), visible) in enumerate(zip(projected_points, is_visible)):
-        if np.isnan(x) or np.isnan(y):
-            # Set NaN points to 0,0 with visibility 0
-            label_parts.extend(["0.000000", "0.000000", "0"])
-        else:
-            # Normalize and add valid points
-            norm_x = x / img_shape[1]
-            norm_y = y / img_shape[0]
-            visibility = 2 if visible else 0
-            label_parts.extend([f"{norm_x:.6f}", f"{norm_y:.6f}", str(visibility)])
-    
-    return " ".join(label_parts)
+
+    bboxes, keypoints = label_arrays(projected_points[np.newaxis], [img_shape[:2]], in_front[np.newaxis],
+                                     None if occluded is None else np.asarray(occluded)[np.newaxis])
+    return format_label(bboxes[0], keypoints[0], class_id)
 
 def reverse_project(colmap_path, images_path, output_dir, key_positions_path=None, 
                    grid_min=(-2,-2,-2), grid_max=(2,2,2), grid_points=4,
-                   skip_copy=False, draw_visualization=False):
+                   skip_copy=False, draw_visualization=False, num_workers=None,
+                   occlusion=None, occlusion_downscale=8, occlusion_tolerance=0.05,
+                   label_format='yolo', shard_size=1000):
     """
     Project 3D points onto images and create dataset.
+
+    The image sizes are taken from the COLMAP cameras, the key positions are projected into all images at once and
+    the labels are written before any image is loaded. Without draw_visualization no image is loaded at all, images
+    whose file does not exist in images_path are skipped.
     
     Args:
         colmap_path: Path to COLMAP sparse reconstruction directory
@@ -180,7 +252,18 @@ def reverse_project(colmap_path, images_path, output_dir, key_positions_path=Non
         grid_points: Number of points per dimension in grid
         skip_copy: If True, don't save visualization images
         draw_visualization: If True, draw grid points and axes on visualization images
+        num_workers: Number of processes writing labels (default: number of CPUs)
+        occlusion: Point cloud hiding key positions, 'sparse' for the COLMAP points or the path to a binary PLY
+            (e.g. fused.ply). Key positions behind it get visibility 1. None disables the test
+        occlusion_downscale: Pixel size of the depth buffer cells used for the occlusion test
+        occlusion_tolerance: Relative depth margin before a key position counts as occluded
+        label_format: 'yolo' writes one label file per image from a process pool, 'jsonl' and 'npz' write the
+            labels of shard_size images into one file each (labels_00000.jsonl, ...)
+        shard_size: Number of images per label file for the 'jsonl' and 'npz' formats
     """
+    if label_format not in ('yolo', 'jsonl', 'npz'):
+        raise ValueError(f"Unsupported label format: {label_format}")
+
     # Create dataset structure
     labels_dir = os.path.join(output_dir, "labels")
     os.makedirs(labels_dir, exist_ok=True)
@@ -191,72 +274,107 @@ def reverse_project(colmap_path, images_path, output_dir, key_positions_path=Non
     
     # Read COLMAP model
     cameras, images, points3D = read_model(colmap_path)
+    image_ids = list(images.keys())
     
-    # Process all images
-    for image_id, image in images.items():
-        print(f"Processing {image.name}...")
-        
-        # Load image
-        img_path = os.path.join(images_path, image.name)
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"Could not load image: {img_path}")
-            continue
-        
-        # Get camera parameters
-        cam_params = cameras[image.camera_id]
-        
-        # Convert quaternion to rotation matrix
-        R = image.qvec2rotmat()
-        t = image.tvec
-        
-        # Convert to OpenCV convention
-        rvec, _ = cv2.Rodrigues(R)
-        tvec = t.reshape(3,1)
-        
-        # Create visualization image if needed
-        vis_img = img.copy() if draw_visualization else None
-        
-        if draw_visualization:
-            # Create and project dense grid of points
-            points = create_dense_grid(min_coords=grid_min, max_coords=grid_max, num_points=grid_points)
-            colors = color_points_by_xyz(points)
-            projected_points, in_front = project_points(points, cam_params, rvec, tvec)
-            
+    # Convert all quaternions to rotation matrices at once
+    R_all = qvecs2rotmats([images[image_id].qvec for image_id in image_ids]).reshape(-1, 3, 3)
+    t_all = np.array([images[image_id].tvec for image_id in image_ids]).reshape(-1, 3)
+    camera_ids = [images[image_id].camera_id for image_id in image_ids]
+
+    # Read key positions once and project them into all images
+    key_points = None
+    if key_positions_path and os.path.exists(key_positions_path):
+        key_points = read_key_positions(key_positions_path)
+        projected_key_points_all, key_in_front_all, _ = project_points_batched(key_points, R_all, t_all,
+                                                                               cameras, camera_ids)
+
+        key_occluded_all = None
+        if occlusion is not None:
+            if occlusion == 'sparse':
+                cloud = np.array([point.xyz for point in points3D.values()]).reshape(-1, 3)
+            else:
+                cloud = read_ply_points(occlusion)
+            key_occluded_all = occluded_points(key_points, cloud, R_all, t_all, cameras, camera_ids,
+                                               downscale=occlusion_downscale, tolerance=occlusion_tolerance)
+            print(f"{np.count_nonzero(key_occluded_all)} key positions occluded by {len(cloud)} points")
+
+    if key_points is not None and len(key_points) > 0:
+        # Image size from the cameras, no need to decode the images
+        img_sizes = [(cameras[camera_id].height, cameras[camera_id].width) for camera_id in camera_ids]
+        bboxes, keypoints = label_arrays(projected_key_points_all, img_sizes, key_in_front_all, key_occluded_all)
+        names = [images[image_id].name for image_id in image_ids]
+
+        # Only label images that exist, checked without decoding them
+        existing = np.array([os.path.exists(os.path.join(images_path, name)) for name in names], dtype=bool)
+        if not existing.all():
+            print(f"Skipping {np.count_nonzero(~existing)} images missing from: {images_path}")
+            names = [name for name, exists in zip(names, existing) if exists]
+            bboxes, keypoints = bboxes[existing], keypoints[existing]
+
+        if label_format == 'yolo':
+            tasks = [(os.path.join(labels_dir, f"{os.path.splitext(name)[0]}.txt"), bboxes[idx], keypoints[idx])
+                     for idx, name in enumerate(names)]
+
+            num_workers = num_workers or os.cpu_count()
+            with Pool(num_workers) as p:
+                p.map(_write_label_task, tasks, chunksize=max(1, len(tasks) // (4 * num_workers)))
+        else:
+            for shard, start in enumerate(range(0, len(names), shard_size)):
+                stop = start + shard_size
+                write_label_shard(os.path.join(labels_dir, f"labels_{shard:05d}.{label_format}"), names[start:stop],
+                                  bboxes[start:stop], keypoints[start:stop])
+        print(f"Saved {len(names)} labels to: {labels_dir}")
+
+    if not draw_visualization:
+        if key_points is None:
+            print("No key positions given, nothing to do")
+        return
+
+    if skip_copy:
+        return
+
+    # Grid, colors and stamps are the same for all images
+    points = create_dense_grid(min_coords=grid_min, max_coords=grid_max, num_points=grid_points)
+    colors = color_points_by_xyz(points)
+    axis_points = np.float32([[0,0,0], [2,0,0], [0,2,0], [0,0,2]])
+    grid_stamp = circle_stamp(3)
+    key_stamp = circle_stamp(15, 3)
+
+    # JPEG encoding runs in a background thread while the next image is loaded and drawn
+    write_queue = queue.Queue(maxsize=8)
+    writer = threading.Thread(target=_write_images, args=(write_queue,), daemon=True)
+    writer.start()
+
+    try:
+        # Process all images
+        for idx, image_id in enumerate(image_ids):
+            image = images[image_id]
+            print(f"Processing {image.name}...")
+
+            # Load image
+            img_path = os.path.join(images_path, image.name)
+            vis_img = cv2.imread(img_path)
+            if vis_img is None:
+                print(f"Could not load image: {img_path}")
+                continue
+
+            # Project grid points and axes into this image
+            pose = (R_all[idx:idx + 1], t_all[idx:idx + 1], cameras, camera_ids[idx:idx + 1])
+            projected_points, in_front, _ = project_points_batched(points, *pose)
+            projected_axes, axes_in_front, _ = project_points_batched(axis_points, *pose)
+
             # Draw grid points (only those in front of camera)
-            for point, color, visible in zip(projected_points, colors, in_front):
-                if visible and not np.isnan(point).any():
-                    x, y = map(int, point)
-                    if 0 <= x < img.shape[1] and 0 <= y < img.shape[0]:
-                        cv2.circle(vis_img, (x, y), 3, color.tolist(), -1)
-            
+            rasterize_points(vis_img, projected_points[0], colors, grid_stamp, in_front[0])
+
             # Draw coordinate axes
-            vis_img = draw_axes(vis_img, cam_params, rvec, tvec, length=2)
-        
-        # Read and project key positions
-        if key_positions_path and os.path.exists(key_positions_path):
-            key_points = read_key_positions(key_positions_path)
-            projected_key_points, key_in_front = project_points(key_points, cam_params, rvec, tvec)
-            
-            # Create label content with visibility information
-            label_content = create_label_content(projected_key_points, img.shape, key_in_front)
-            
-            if label_content is not None:
-                # Save label
-                label_path = os.path.join(labels_dir, f"{os.path.splitext(image.name)[0]}.txt")
-                with open(label_path, 'w') as f:
-                    f.write(label_content)
-            
-            # Draw keypoints for visualization if enabled
-            if draw_visualization:
-                for point, visible in zip(projected_key_points, key_in_front):
-                    if visible and not np.isnan(point).any():
-                        x, y = map(int, point)
-                        if 0 <= x < img.shape[1] and 0 <= y < img.shape[0]:
-                            cv2.circle(vis_img, (x, y), 15, (0, 255, 255), 3)
-        
-        # Save visualization if enabled and not skipping
-        if draw_visualization and not skip_copy:
-            output_path = os.path.join(vis_dir, f"vis_{image.name}")
-            cv2.imwrite(output_path, vis_img)
-            print(f"Saved visualization to: {output_path}")
+            vis_img = draw_projected_axes(vis_img, projected_axes[0], axes_in_front[0])
+
+            # Key positions were projected for all images at once
+            if key_points is not None:
+                rasterize_points(vis_img, projected_key_points_all[idx], (0, 255, 255), key_stamp,
+                                 key_in_front_all[idx])
+
+            write_queue.put((os.path.join(vis_dir, f"vis_{image.name}"), vis_img))
+    finally:
+        write_queue.put(None)
+        writer.join()
@@ -113,7 +113,8 @@ class ArucoVisualization(ScaleFactorExtimatorVisualization):
 
         for image_idx in self.photogrammetry_software.images.keys():
 
-            if self.photogrammetry_software.images[image_idx].aruco_corners == None:
+            # Images without the target marker have no rays
+            if self.photogrammetry_software.images[image_idx].n is None:
                 aruco_line_set = generate_line_set(points=[],
                                                    lines=[],
                                                    color=[1, 0, 0])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (c) 2022 Lukas Meyer
+Licensed under the MIT License.
+See LICENSE file for more information.
+"""
+
+# Built-in/Generic Imports
+import argparse
+import glob
+import os
+import time
+
+import cv2
+
+from aruco_estimator.aruco import detect_aruco_markers
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the parallel backends of the marker detection.')
+    parser.add_argument('--images', type=str, required=True, help='Folder with the images')
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count()],
+                        help='Worker counts to benchmark, e.g. 8 32 96')
+    parser.add_argument('--backends', type=str, nargs='+', default=['process', 'thread', 'pipeline'],
+                        choices=['process', 'thread', 'pipeline'], help='Backends to benchmark')
+    parser.add_argument('--reduction', type=int, default=1, choices=[1, 2, 4, 8],
+                        help='Detection reduction, see detect_aruco_marker')
+    parser.add_argument('--dict_type', type=int, default=cv2.aruco.DICT_4X4_50, help='ArUco dictionary type')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per configuration, the fastest one is reported')
+    args = parser.parse_args()
+
+    image_paths = sorted(path for path in glob.glob(os.path.join(args.images, '*'))
+                         if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg', '.png'))
+    if len(image_paths) == 0:
+        raise ValueError(f'No images found in {args.images}')
+
+    print(f'{len(image_paths)} images, {os.cpu_count()} CPUs')
+    print(f'{"backend":>8} {"workers":>8} {"seconds":>10} {"images/s":>10} {"markers":>8}')
+    for num_workers in args.workers:
+        for backend in args.backends:
+            durations = []
+            for _ in range(args.repeats):
+                start_time = time.perf_counter()
+                results = detect_aruco_markers(image_paths,
+                                               dict_type=args.dict_type,
+                                               reduction=args.reduction,
+                                               backend=backend,
+                                               num_workers=num_workers,
+                                               progress_bar=False)
+                durations.append(time.perf_counter() - start_time)
+
+            num_markers = sum(len(result[1]) for result in results if result[1] is not None)
+            duration = min(durations)
+            print(f'{backend:>8} {num_workers:>8} {duration:>10.3f} {len(image_paths) / duration:>10.1f} '
+                  f'{num_markers:>8}')